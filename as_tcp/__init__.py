@@ -1,4 +1,6 @@
 # re-export sub-module in module
 
+from .bloom import *
+from .index import *
 from .server import *
 from .util import *
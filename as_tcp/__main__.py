@@ -1,28 +1,69 @@
+import argparse
+
 # third party libraries
-from aiorun import run
 import daemon
 
 
 # Project Modules
-from .server import serve
 from .setup import (
+    BLOOM_FILTER,
+    BLOOM_PATH,
+    DATA_PATHS,
     IP_ADRESS,
+    LINUXPATH,
     PORT,
     REREAD,
+    SORTED_INDEX,
+    SORTED_INDEX_PATH,
     FILEPATH,
+    INDEX_PATH,
+    WORKERS,
+    file_handler,
     logger,
+    remove_handler,
     stdout_handler
 )
-from .util import load_file, hash_file
+from .bloom import load_bloom, set_bloom
+from .index import index_dataset, set_index
+from .prefix import load_sorted, set_sorted
+from .server import set_data_version
+from .util import open_descriptors
+from .watcher import dataset_version
+from .workers import inherited_sockets, supervise, worker_count
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='python -m as_tcp',
+        description='Serves file lookups over TCP')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=WORKERS,
+        help='number of worker processes, 0 starts one per cpu core')
+    args = parser.parse_args()
+    workers = worker_count(args.workers)
+
+    # set when a reload of a running supervisor started this one
+    parent, inherited = inherited_sockets()
+
+    # index before forking so workers share the pages, workers restarted
+    # later reload whatever changed since
+    set_data_version(dataset_version(LINUXPATH))
+    if BLOOM_FILTER:
+        set_bloom(load_bloom(FILEPATH, BLOOM_PATH))
     if not REREAD:
-        m_file = load_file(FILEPATH)
-        hash_file(m_file)
+        set_index(index_dataset(DATA_PATHS, INDEX_PATH))
+    if SORTED_INDEX:
+        set_sorted(load_sorted(FILEPATH, SORTED_INDEX_PATH))
 
-    logger.info('Serving on {}'.format((IP_ADRESS, PORT)))
-    logger.removeHandler(stdout_handler)
+    logger.info('Serving on {} with {} workers'.format(
+        (IP_ADRESS, PORT), workers))
+    remove_handler(stdout_handler)
 
-    # start server deamon
-    with daemon.DaemonContext():
-        run(serve(IP_ADRESS, PORT))
+    # start server deamon, keeping the log file, inherited sockets and the
+    # files the memory maps hold open, a reload runs detached already
+    files = [file_handler.stream] + [
+        sock for pair in inherited for sock in pair if sock is not None]
+    files += open_descriptors()
+    detach = None if parent is None else False
+    # a single worker is supervised too, so SIGHUP reloads the configuration
+    with daemon.DaemonContext(files_preserve=files, detach_process=detach):
+        supervise(IP_ADRESS, PORT, workers, inherited, parent)
@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+from collections import deque
+import configparser
+import json
+import mmap
+import os
+from os import path
+from pathlib import Path
+import random
+import sys
+from timeit import default_timer as timer
+
+# the client only reads where the server is from its configuration, and
+# leaves the data file checks and the log file of as_tcp.setup to the server
+BASE_DIR = Path(__file__).resolve().parent
+INI_FILE = 'config.ini'
+
+config = configparser.ConfigParser()
+config.read(BASE_DIR / INI_FILE)
+
+IP_ADRESS = config['DEFAULT'].get('IP_ADDRESS', '127.0.0.1')
+PORT = config['DEFAULT'].getint('PORT', 8888)
+LINUXPATH = config['DEFAULT'].get('LINUXPATH', '')
+
+# data file hits are sampled from unless another one is passed
+if path.exists(LINUXPATH):
+    DATA_PATH = LINUXPATH
+else:
+    DATA_PATH = str(BASE_DIR / LINUXPATH)
+
+# responses of the server when the debug block is off
+FOUND_RESPONSE = b'STRING EXISTS\r\n'
+NOT_FOUND_RESPONSE = b'STRING NOT FOUND\r\n'
+OK_RESPONSE = b'OK\r\n'
+
+# percentiles of latency reported
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def sample_lines(path, count, seed=None):
+    """
+    picks random lines of the data file to be used as hits
+
+    Parameters:
+    path(string): data file
+    count(int): number of lines to pick
+    seed(int): seed of the random generator
+
+    Returns:
+    list: stripped lines, empty if the file has no lines
+
+    """
+
+    rand = random.Random(seed)
+    size = os.path.getsize(path)
+    if not size:
+        return []
+
+    lines = []
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for _ in range(count * 2):
+            # the line following a random offset
+            start = data.rfind(b'\n', 0, rand.randrange(size)) + 1
+            end = data.find(b'\n', start)
+            line = data[start:end if end >= 0 else size].strip()
+            if line:
+                lines.append(line)
+                if len(lines) == count:
+                    break
+
+    return lines
+
+
+def make_queries(hits, count, hit_ratio, seed=None):
+    """
+    builds the query mix sent by the benchmark
+
+    Parameters:
+    hits(list): lines of the data file
+    count(int): number of queries
+    hit_ratio(float): share of queries that are lines of the file
+    seed(int): seed of the random generator
+
+    Returns:
+    list: (query, expected) tuples, expected being 'True' for hits
+
+    """
+
+    rand = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        if hits and rand.random() < hit_ratio:
+            queries.append((rand.choice(hits), True))
+        else:
+            # random tokens are all but certainly missing from the file
+            miss = 'as_tcp-bench-{:032x}'.format(rand.getrandbits(128))
+            queries.append((miss.encode(), False))
+    return queries
+
+
+def percentile(latencies, rank):
+    """
+    gets a percentile of sorted latencies by the nearest rank
+
+    Parameters:
+    latencies(list): sorted latencies
+    rank(float): percentile between 0 and 100
+
+    Returns:
+    float: latency, 0 if there are none
+
+    """
+
+    if not latencies:
+        return 0.0
+
+    index = max(0, -(-len(latencies) * rank // 100) - 1)
+    return latencies[min(int(index), len(latencies) - 1)]
+
+
+class Budget:
+    """
+    Shared stop condition of the connections: a request count, a deadline
+    or both
+    """
+
+    def __init__(self, requests=0, duration=0.0):
+        self.left = requests or None
+        self.deadline = timer() + duration if duration else None
+
+    def take(self):
+        """
+        claims the next request
+
+        Returns:
+        bool: 'False' once the benchmark is over
+
+        """
+
+        if self.deadline is not None and timer() >= self.deadline:
+            return False
+
+        if self.left is not None:
+            if self.left <= 0:
+                return False
+            self.left -= 1
+
+        return True
+
+
+async def run_connection(host, port, queries, depth, budget, stats):
+    """
+    sends queries over one connection keeping up to depth of them in
+    flight, and records the latency of each response
+
+    Parameters:
+    host(string): server address
+    port(int): server port
+    queries(list): (query, expected) tuples sent in turn
+    depth(int): largest number of queries awaiting a response
+    budget(Budget): stop condition shared by the connections
+    stats(dict): latencies and counters of the benchmark
+
+    Returns:
+    None
+
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+
+    # the debug block would make responses span several lines
+    writer.write(b'!DEBUG OFF\n')
+    if await reader.readline() != OK_RESPONSE:
+        raise ConnectionError('server refused !DEBUG OFF')
+
+    inflight = deque()
+    sent = asyncio.Event()
+    window = asyncio.Semaphore(depth)
+    latencies = stats['latencies']
+
+    async def send():
+        position = random.randrange(len(queries))
+        while True:
+            await window.acquire()
+            if not budget.take():
+                break
+
+            query, expected = queries[position]
+            position = (position + 1) % len(queries)
+            inflight.append((timer(), expected))
+            sent.set()
+            writer.write(query + b'\n')
+            await writer.drain()
+
+        # lets the reader finish once everything is answered
+        inflight.append(None)
+        sent.set()
+
+    async def receive():
+        while True:
+            while not inflight:
+                sent.clear()
+                await sent.wait()
+
+            if inflight[0] is None:
+                return
+
+            response = await reader.readline()
+            if not response:
+                raise ConnectionError('server closed the connection')
+
+            start, expected = inflight.popleft()
+            latencies.append(timer() - start)
+            window.release()
+
+            if response == FOUND_RESPONSE:
+                found = True
+            elif response == NOT_FOUND_RESPONSE:
+                found = False
+            else:
+                stats['errors'] += 1
+                continue
+
+            if found != expected:
+                stats['unexpected'] += 1
+
+    try:
+        await asyncio.gather(send(), receive())
+    finally:
+        writer.close()
+
+
+async def benchmark(host, port, queries, connections=16, depth=1,
+                    requests=0, duration=10.0):
+    """
+    runs the benchmark and summarizes it
+
+    Parameters:
+    host(string): server address
+    port(int): server port
+    queries(list): (query, expected) tuples
+    connections(int): number of concurrent connections
+    depth(int): pipeline depth of each connection
+    requests(int): total number of queries, 0 for no limit
+    duration(float): seconds to run, 0 for no limit
+
+    Returns:
+    dict: report of throughput and latency percentiles in ms
+
+    """
+
+    budget = Budget(requests, duration)
+    stats = {'latencies': [], 'errors': 0, 'unexpected': 0}
+
+    start = timer()
+    results = await asyncio.gather(
+        *(run_connection(host, port, queries, depth, budget, stats)
+          for _ in range(connections)),
+        return_exceptions=True)
+    elapsed = timer() - start
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    latencies = sorted(stats['latencies'])
+
+    report = {
+        'connections': connections,
+        'pipeline': depth,
+        'requests': len(latencies),
+        'errors': stats['errors'],
+        'unexpected': stats['unexpected'],
+        'failed_connections': len(failed),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p{:g}'.format(rank): percentile(latencies, rank) * 1000
+            for rank in PERCENTILES
+        },
+    }
+    report['latency_ms']['max'] = latencies[-1] * 1000 if latencies else 0.0
+    if failed:
+        report['failure'] = repr(failed[0])
+    return report
+
+
+def format_report(report):
+    """
+    formats a report for the terminal
+
+    Parameters:
+    report(dict): report of the benchmark
+
+    Returns:
+    string: report as text
+
+    """
+
+    lines = [
+        '{requests} requests in {seconds:.2f} s over {connections} '
+        'connections, pipeline {pipeline}'.format(**report),
+        'throughput: {:.0f} req/s'.format(report['throughput']),
+        'latency: ' + ', '.join(
+            '{} {:.3f} ms'.format(name, value)
+            for name, value in report['latency_ms'].items()),
+        'errors: {errors}, unexpected answers: {unexpected}, '
+        'failed connections: {failed_connections}'.format(**report),
+    ]
+    if 'failure' in report:
+        lines.append('first failure: {}'.format(report['failure']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python as_tcp/bench.py',
+        description='Load tests a running as_tcp server')
+    parser.add_argument('--host', default=IP_ADRESS, help='server address')
+    parser.add_argument('--port', type=int, default=PORT, help='server port')
+    parser.add_argument(
+        '-c', '--connections', type=int, default=16,
+        help='number of concurrent connections')
+    parser.add_argument(
+        '-p', '--pipeline', type=int, default=1,
+        help='queries in flight on each connection')
+    parser.add_argument(
+        '-d', '--duration', type=float, default=10.0,
+        help='seconds to run, 0 to only stop after --requests')
+    parser.add_argument(
+        '-n', '--requests', type=int, default=0,
+        help='total number of queries, 0 to only stop after --duration')
+    parser.add_argument(
+        '--hit-ratio', type=float, default=0.5,
+        help='share of queries that are lines of the data file')
+    parser.add_argument(
+        '--data', default=DATA_PATH,
+        help='data file the hits are sampled from')
+    parser.add_argument(
+        '--queries', type=int, default=10000,
+        help='number of distinct queries cycled through')
+    parser.add_argument('--seed', type=int, help='seed of the query mix')
+    parser.add_argument(
+        '--json', metavar='PATH',
+        help="also write the report as JSON, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    if not args.duration and not args.requests:
+        parser.error('one of --duration or --requests is needed')
+    if args.hit_ratio > 0 and not path.isfile(args.data):
+        parser.error('--data {!r} is not a file'.format(args.data))
+
+    hits = []
+    if args.hit_ratio > 0:
+        hits = sample_lines(args.data, args.queries, args.seed)
+    queries = make_queries(hits, args.queries, args.hit_ratio, args.seed)
+
+    report = asyncio.run(benchmark(
+        args.host, args.port, queries,
+        connections=args.connections,
+        depth=max(1, args.pipeline),
+        requests=args.requests,
+        duration=args.duration))
+    report['hit_ratio'] = args.hit_ratio
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_report(report))
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    return 1 if report['requests'] == 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import math
+import mmap
+import os
+import struct
+from timeit import default_timer as timer
+
+# Project Modules
+from .index import build_segment, line_hash, map_data
+from .setup import (
+    BLOOM_ERROR_RATE,
+    BLOOM_MAX_BYTES,
+    logger
+)
+from .util import file_lock
+
+# magic, version, data device, inode, size and mtime in ns, number of bits,
+# number of hash functions
+HEADER = struct.Struct('<8sIQQQqQI')
+MAGIC = b'ASTCPBLM'
+VERSION = 2
+BLOOM_SUFFIX = '.bloom'
+
+# filter currently used to answer definite misses, None when disabled
+_bloom = None
+
+
+def get_bloom():
+    """
+    gets the filter used to answer definite misses
+
+    Returns:
+    BloomFilter: current filter, None when disabled
+
+    """
+
+    return _bloom
+
+
+def set_bloom(bloom):
+    """
+    replaces the filter used to answer definite misses
+
+    Parameters:
+    bloom(BloomFilter): filter to be used by subsequent lookups
+
+    Returns:
+    None
+
+    """
+
+    global _bloom
+    _bloom = bloom
+
+
+def bloom_path(path):
+    """
+    gets the path of the filter file kept beside a data file
+
+    Parameters:
+    path(path): path to data file
+
+    Returns:
+    string: path to filter file
+
+    """
+
+    return '{}{}'.format(path, BLOOM_SUFFIX)
+
+
+def filter_size(lines, error_rate, max_bytes):
+    """
+    sizes a filter for a number of lines and a false positive rate
+
+    Parameters:
+    lines(int): number of lines to be added
+    error_rate(float): wanted false positive rate
+    max_bytes(int): upper bound of the filter size in bytes
+
+    Returns:
+    tuple: number of bits and number of hash functions
+
+    """
+
+    lines = max(lines, 1)
+    bits = -lines * math.log(error_rate) / (math.log(2) ** 2)
+    bits = max(8, min(int(bits), max_bytes * 8)) // 8 * 8
+    hashes = max(1, round(bits / lines * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    Probabilistic set of line hashes of one version of a data file, it has
+    no false negatives so a miss in the filter is a miss in the file
+    """
+
+    def __init__(self, bits, hashes, table, key):
+        self.bits = bits
+        self.hashes = hashes
+        self.table = table
+        self.key = key
+
+    def positions(self, value):
+        # derive every position from the two halves of the line hash
+        low = value & 0xFFFFFFFF
+        high = value >> 32 | 1
+        for i in range(self.hashes):
+            yield (low + i * high) % self.bits
+
+    def add(self, value):
+        table = self.table
+        for position in self.positions(value):
+            table[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        table = self.table
+        for position in self.positions(value):
+            if not table[position >> 3] & 1 << (position & 7):
+                return False
+        return True
+
+    def may_contain(self, line):
+        """
+        checks whether a line can be in the data file
+
+        Parameters:
+        line(bytes): stripped line
+
+        Returns:
+        bool: 'False' if the line is definitely not in the data file
+
+        """
+
+        return line_hash(line) in self
+
+
+def build_bloom(path, output, error_rate=BLOOM_ERROR_RATE,
+                max_bytes=BLOOM_MAX_BYTES):
+    """
+    adds every line of a data file to a new filter and writes it
+
+    Parameters:
+    path(path): path to data file
+    output(path): path of the filter file to be written
+    error_rate(float): wanted false positive rate
+    max_bytes(int): upper bound of the filter size in bytes
+
+    Returns:
+    None
+
+    """
+
+    start = timer()
+    data, stat = map_data(path)
+    values, _ = build_segment(path, data)
+    bits, hashes = filter_size(len(values), error_rate, max_bytes)
+
+    bloom = BloomFilter(bits, hashes, bytearray(bits // 8), None)
+    for value in values:
+        bloom.add(value)
+
+    temp = '{}.{}.tmp'.format(output, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, stat.st_dev, stat.st_ino, stat.st_size,
+            stat.st_mtime_ns, bits, hashes))
+        f.write(bloom.table)
+    os.replace(temp, output)
+
+    logger.info('built {} KB bloom filter of {} in {:.3f} s'.format(
+        bits // 8192, path, timer() - start))
+
+
+def open_bloom(path, output):
+    """
+    maps a filter file if it is up to date with its data file
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to filter file
+
+    Returns:
+    BloomFilter: filter, None if missing or stale
+
+    """
+
+    try:
+        f = open(output, 'rb')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+
+    magic, version, dev, ino, size, mtime, bits, hashes = \
+        HEADER.unpack_from(mapped)
+    stat = os.stat(path)
+    key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if (magic != MAGIC or version != VERSION
+            or (dev, ino, size, mtime) != key
+            or len(mapped) != HEADER.size + bits // 8):
+        logger.info('bloom filter {} is stale'.format(output))
+        return None
+
+    table = memoryview(mapped)[HEADER.size:]
+    return BloomFilter(bits, hashes, table, key)
+
+
+def load_bloom(path, output=None):
+    """
+    loads the filter of a data file, rebuilding it only when stale
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to filter file, defaults to beside the data file
+
+    Returns:
+    BloomFilter: filter of the data file
+
+    """
+
+    output = output or bloom_path(path)
+
+    bloom = open_bloom(path, output)
+    if bloom is None:
+        with file_lock(output):
+            bloom = open_bloom(path, output)
+            if bloom is None:
+                build_bloom(path, output)
+                bloom = open_bloom(path, output)
+
+    return bloom
+
+
+def reload_bloom(path, output=None):
+    """
+    rebuilds the filter of a data file and swaps it in once it is ready,
+    lookups skip a filter that does not match the data file meanwhile
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to filter file, defaults to beside the data file
+
+    Returns:
+    None
+
+    """
+
+    set_bloom(load_bloom(path, output))
+    logger.info('bloom filter of {} swapped'.format(path))
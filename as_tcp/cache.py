@@ -0,0 +1,99 @@
+from collections import OrderedDict
+
+# Project Modules
+from .setup import CACHE_SIZE, logger
+
+
+class ResultCache:
+    """
+    Least recently used cache of REREAD lookup results, valid for a single
+    version of the data file and dropped as soon as another one is seen
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.key = None
+        self.results = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def validate(self, key):
+        """
+        drops every result when the data file is no longer the version they
+        were looked up in
+
+        Parameters:
+        key(tuple): device, inode, size and mtime of the data file
+
+        Returns:
+        None
+
+        """
+
+        if key == self.key:
+            return
+
+        if self.results:
+            self.invalidations += 1
+            logger.debug('dropped {} cached results of {}'.format(
+                len(self.results), self.key))
+            self.results.clear()
+        self.key = key
+
+    def get(self, key, query):
+        """
+        gets the cached result of a query
+
+        Parameters:
+        key(tuple): version of the data file being looked up
+        query(bytes): stripped query
+
+        Returns:
+        bool: whether the query is in the file, None if it is not cached
+
+        """
+
+        if not self.size:
+            return None
+
+        self.validate(key)
+        found = self.results.get(query)
+        if found is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.results.move_to_end(query)
+        return found
+
+    def put(self, key, query, found):
+        """
+        caches the result of a query, unless the file changed since
+
+        Parameters:
+        key(tuple): version of the data file the query was looked up in
+        query(bytes): stripped query
+        found(bool): whether the query is in the file
+
+        Returns:
+        None
+
+        """
+
+        if not self.size or key != self.key:
+            return
+
+        self.results[query] = found
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+
+# results of REREAD lookups in this process
+RESULT_CACHE = ResultCache()
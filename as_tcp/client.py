@@ -13,7 +13,8 @@ from as_tcp.setup import (
     logger,
     config,
 )
-from as_tcp.util import hash_file, load_file
+from as_tcp.index import hash_file, set_index
+from as_tcp.util import add_new_line, load_file
 
 IP_ADRESS = config['TEST'].get('IP_ADDRESS')
 PORT = config['TEST'].getint('PORT')
@@ -39,12 +40,13 @@ class ClientTestServerProtocol(ServerProtocol):
     def get_bytes(self):
         return load_file(FILEPATH)
 
-    def data_received(self, data):
-
-        super().data_received(data)
+    def flush(self):
+        super().flush()
 
-        logger.debug('Close the client socket')
-        self.transport.close()
+        # close once every query received so far has been answered
+        if not self.pending:
+            logger.debug('Close the client socket')
+            self.transport.close()
 
     def connection_lost(self, exc):
         super().connection_lost(exc)
@@ -76,7 +78,7 @@ class ClientProtocol(asyncio.Protocol):
 if __name__ == '__main__':
     # Loading and hashing file
     if not REREAD:
-        hash_file(load_file(FILEPATH))
+        set_index(hash_file(load_file(FILEPATH)))
 
     # get current event loop
     loop = asyncio.get_event_loop()
@@ -88,7 +90,7 @@ if __name__ == '__main__':
     # Setting up client
     client = serial_asyncio.create_serial_connection(
         loop,
-        lambda: ClientProtocol(TEST_STRING),
+        lambda: ClientProtocol(add_new_line(TEST_STRING)),
         'socket://{}:{}'.format(IP_ADRESS, str(PORT)))
 
     # Start event Loop and wait till all event is done
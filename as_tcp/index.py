@@ -0,0 +1,932 @@
+from array import array
+from bisect import bisect_left
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import multiprocessing
+import mmap
+import os
+import struct
+import zlib
+from timeit import default_timer as timer
+
+# Project Modules
+from .setup import (
+    LINE_END,
+    INDEX_CHUNK_BYTES,
+    INDEX_MAX_SEGMENTS,
+    INDEX_WORKERS,
+    PERSIST_INDEX,
+    logger
+)
+from .util import close_map, file_key, file_lock
+
+# magic, version, number of segments, indexed data size, data mtime in ns,
+# checksums of the first and the last indexed bytes
+HEADER = struct.Struct('<8sIIQqII')
+# number of lines in a segment, followed by its hashes and offsets
+SEGMENT = struct.Struct('<Q')
+MAGIC = b'ASTCPIDX'
+VERSION = 3
+INDEX_SUFFIX = '.idx'
+CHECKSUM_BYTES = 4096
+HASH_SEED = 0x9E3779B9
+# bytes split into lines at once while hashing
+BLOCK_BYTES = 16 * 1024 * 1024
+# bytes read at once to verify a candidate line
+READ_BYTES = 4096
+
+
+def get_index():
+    """
+    gets the index used for hash mode lookups
+
+    Returns:
+    LineIndex: current index
+
+    """
+
+    return _index
+
+
+def set_index(index):
+    """
+    replaces the index used for hash mode lookups
+
+    Parameters:
+    index(LineIndex): index to be used by subsequent lookups
+
+    Returns:
+    None
+
+    """
+
+    global _index
+    _index = index
+
+
+def line_hash(line):
+    """
+    stable 64 bit hash of a line, equal across processes and restarts
+
+    Parameters:
+    line(bytes): stripped line
+
+    Returns:
+    int: 64 bit hash
+
+    """
+
+    # two differently seeded crc32 are several times cheaper than a
+    # cryptographic digest, collisions are verified against the data anyway
+    return zlib.crc32(line) << 32 | zlib.crc32(line, HASH_SEED)
+
+
+def iter_lines(data, start=0, end=None):
+    """
+    yields the non empty stripped lines of a buffer with their offsets
+
+    Parameters:
+    data(bytes): buffer to be split into lines
+    start(int): offset of the first line
+    end(int): offset where iteration stops, defaults to end of buffer
+
+    Returns:
+    generator: (offset, line) tuples
+
+    """
+
+    if end is None:
+        end = len(data)
+
+    while start < end:
+        stop = data.find(LINE_END, start, end)
+        if stop < 0:
+            stop = end
+        line = data[start:stop].strip()
+        if line:
+            yield start, line
+        start = stop + 1
+
+
+def index_path(path):
+    """
+    gets the path of the index file kept beside a data file
+
+    Parameters:
+    path(path): path to data file
+
+    Returns:
+    string: path to index file
+
+    """
+
+    return '{}{}'.format(path, INDEX_SUFFIX)
+
+
+class DataFile:
+    """
+    Read only descriptor of a data file reading lines with pread, a file
+    truncated in place reads short where a mapping of it would fault
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def __del__(self):
+        # missing when opening the file failed
+        if hasattr(self, 'fd'):
+            os.close(self.fd)
+
+    def fstat(self):
+        return os.fstat(self.fd)
+
+    def line_at(self, offset):
+        """
+        reads the stripped line starting at offset
+
+        Parameters:
+        offset(int): offset of the line in the data file
+
+        Returns:
+        bytes: stripped line, empty past the end of the file
+
+        """
+
+        chunks = []
+        while True:
+            chunk = os.pread(self.fd, READ_BYTES, offset)
+            end = chunk.find(LINE_END)
+            if end >= 0:
+                chunks.append(chunk[:end])
+                break
+            chunks.append(chunk)
+            if len(chunk) < READ_BYTES:
+                break
+            offset += len(chunk)
+
+        return b''.join(chunks).strip()
+
+
+class LineIndex:
+    """
+    Read only set of the lines of a data file, stored as segments of sorted
+    64 bit line hashes with the offsets of the lines they were computed from
+    """
+
+    def __init__(self, data, segments):
+        self.data = data
+        self.segments = segments
+
+    def __len__(self):
+        return sum(len(hashes) for hashes, _ in self.segments)
+
+    def __contains__(self, line):
+        return self.contains_hash(line, line_hash(line))
+
+    def contains_hash(self, line, value):
+        """
+        looks up a line whose hash is already known
+
+        Parameters:
+        line(bytes): stripped line
+        value(int): hash of the line
+
+        Returns:
+        bool: whether the line is in the data file
+
+        """
+
+        for hashes, offsets in self.segments:
+            position = bisect_left(hashes, value)
+
+            # verify candidates against the data file to rule out collisions
+            # and entries of lines that have since been appended to
+            while position < len(hashes) and hashes[position] == value:
+                if self.line_at(offsets[position]) == line:
+                    return True
+                position += 1
+
+        return False
+
+    def line_at(self, offset):
+        """
+        reads the stripped line starting at offset
+
+        Parameters:
+        offset(int): offset of the line in the data file
+
+        Returns:
+        bytes: stripped line
+
+        """
+
+        if isinstance(self.data, DataFile):
+            return self.data.line_at(offset)
+
+        end = self.data.find(LINE_END, offset)
+        if end < 0:
+            end = len(self.data)
+        return self.data[offset:end].strip()
+
+
+class ShardedIndex:
+    """
+    Read only set of the lines of several data files, one LineIndex shard
+    per file, a line being looked up in every shard
+    """
+
+    def __init__(self, shards):
+        # version of each data file when it was indexed and its shard
+        self.shards = shards
+        self.indexes = [index for _, index in shards.values()]
+
+    def __len__(self):
+        return sum(map(len, self.indexes))
+
+    def __contains__(self, line):
+        # the hash is computed once for all the shards
+        value = line_hash(line)
+        for index in self.indexes:
+            if index.contains_hash(line, value):
+                return True
+
+        return False
+
+
+# index currently used for lookups, swapped as a whole on reload
+_index = LineIndex(b'', [])
+
+
+def map_data(path):
+    """
+    maps a data file read only, empty files map to empty bytes
+
+    Parameters:
+    path(path): path to data file
+
+    Returns:
+    tuple: memory mapped data file and the stat it was mapped with
+
+    """
+
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return b'', stat
+
+        # map only the bytes the stat describes even if the file grows
+        return mmap.mmap(
+            f.fileno(), stat.st_size, prot=mmap.PROT_READ), stat
+
+
+def checksums(data, size):
+    """
+    checksums the first and the last indexed bytes of a data file
+
+    Parameters:
+    data(bytes): memory mapped data file
+    size(int): number of indexed bytes
+
+    Returns:
+    tuple: crc32 of the head and of the edge of the indexed bytes
+
+    """
+
+    head = zlib.crc32(data[:min(size, CHECKSUM_BYTES)])
+    edge = zlib.crc32(data[max(0, size - CHECKSUM_BYTES):size])
+    return head, edge
+
+
+def hash_entries(data, start=0, end=None):
+    """
+    hashes the lines of a buffer, splitting a block of lines at a time
+
+    Parameters:
+    data(bytes): buffer to be hashed
+    start(int): offset of the first line
+    end(int): offset where hashing stops, defaults to end of buffer
+
+    Returns:
+    list: unsorted entries, the line hash in the high and the offset in the
+    low 64 bits
+
+    """
+
+    if end is None:
+        end = len(data)
+
+    entries = []
+    for block_start, block_end in chunk_bounds(data, start, end, BLOCK_BYTES):
+        offset = block_start
+        for raw in data[block_start:block_end].split(LINE_END):
+            line = raw.strip()
+            if line:
+                entries.append(line_hash(line) << 64 | offset)
+            offset += len(raw) + 1
+
+    return entries
+
+
+def split_entries(entries):
+    """
+    sorts entries into a segment
+
+    Parameters:
+    entries(list): entries as returned by hash_entries
+
+    Returns:
+    tuple: arrays of sorted hashes and of the offsets of their lines
+
+    """
+
+    entries.sort()
+    hashes = array('Q', [entry >> 64 for entry in entries])
+    offsets = array('Q', [entry & 0xFFFFFFFFFFFFFFFF for entry in entries])
+    return hashes, offsets
+
+
+def hash_lines(data, start=0, end=None):
+    """
+    hashes the lines of a buffer into a sorted segment
+
+    Parameters:
+    data(bytes): buffer to be hashed
+    start(int): offset of the first line
+    end(int): offset where hashing stops, defaults to end of buffer
+
+    Returns:
+    tuple: arrays of sorted hashes and of the offsets of their lines
+
+    """
+
+    return split_entries(hash_entries(data, start, end))
+
+
+def chunk_bounds(data, start, end, size):
+    """
+    splits a range of a buffer into chunks that end after a line terminator
+
+    Parameters:
+    data(bytes): buffer to be split
+    start(int): offset of the range
+    end(int): end of the range
+    size(int): approximate size of a chunk
+
+    Returns:
+    list: (start, end) tuples covering the range
+
+    """
+
+    bounds = []
+    while start < end:
+        stop = data.find(LINE_END, min(start + size, end) - 1, end) + 1
+        if stop <= 0:
+            stop = end
+        bounds.append((start, stop))
+        start = stop
+
+    return bounds
+
+
+def hash_chunk(path, start, end):
+    """
+    hashes a chunk of a data file in a builder process
+
+    Parameters:
+    path(path): path to data file
+    start(int): offset of the chunk
+    end(int): end of the chunk
+
+    Returns:
+    tuple: sorted hashes and offsets of the chunk as bytes
+
+    """
+
+    data, _ = map_data(path)
+    hashes, offsets = hash_lines(data, start, end)
+    return hashes.tobytes(), offsets.tobytes()
+
+
+def merge_range(runs):
+    """
+    merges the slices of sorted runs covering one range of hashes in a
+    builder process
+
+    Parameters:
+    runs(list): sorted hashes and offsets of each run as bytes, in the
+        order of the chunks in the data file
+
+    Returns:
+    tuple: sorted hashes and offsets of the range as bytes
+
+    """
+
+    hashes, offsets = array('Q'), array('Q')
+    for run_hashes, run_offsets in runs:
+        hashes.frombytes(run_hashes)
+        offsets.frombytes(run_offsets)
+
+    # a stable sort of runs in file order keeps equal hashes in offset order
+    order = sorted(range(len(hashes)), key=hashes.__getitem__)
+    return (array('Q', map(hashes.__getitem__, order)).tobytes(),
+            array('Q', map(offsets.__getitem__, order)).tobytes())
+
+
+def build_segment(path, data, start=0, chunk_bytes=INDEX_CHUNK_BYTES,
+                  workers=INDEX_WORKERS):
+    """
+    hashes the lines of a data file into a sorted segment, spreading
+    newline aligned chunks over a pool of builder processes, then merging
+    the sorted chunks one range of hashes per builder
+
+    Parameters:
+    path(path): path to data file
+    data(bytes): memory mapped data file
+    start(int): offset of the first line
+    chunk_bytes(int): approximate size of the chunk hashed by one task
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    tuple: arrays of sorted hashes and of the offsets of their lines
+
+    """
+
+    began = timer()
+    bounds = chunk_bounds(data, start, len(data), chunk_bytes)
+    workers = min(len(bounds), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return hash_lines(data, start)
+
+    # spawn, the builder may run beside the event loop and watcher threads
+    context = multiprocessing.get_context('spawn')
+    runs = [None] * len(bounds)
+    lines = done = 0
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = {pool.submit(hash_chunk, path, *bound): position
+                   for position, bound in enumerate(bounds)}
+
+        for future in as_completed(futures):
+            hashes, offsets = array('Q'), array('Q')
+            hashes.frombytes(future.result()[0])
+            offsets.frombytes(future.result()[1])
+            position = futures[future]
+            runs[position] = hashes, offsets
+
+            lines += len(hashes)
+            chunk_start, chunk_end = bounds[position]
+            done += chunk_end - chunk_start
+            elapsed = timer() - began
+            logger.info('hashed {:.1f}% of {}, {:.0f} lines/s'.format(
+                100 * done / (len(data) - start), path, lines / elapsed))
+
+        # hashes are uniform, so even ranges of them split the merge evenly
+        cuts = [0] + [(1 << 64) * part // workers
+                      for part in range(1, workers)] + [1 << 64]
+        merges = []
+        for low, high in zip(cuts, cuts[1:]):
+            slices = []
+            for hashes, offsets in runs:
+                first = bisect_left(hashes, low)
+                last = bisect_left(hashes, high)
+                slices.append((hashes[first:last].tobytes(),
+                               offsets[first:last].tobytes()))
+            merges.append(pool.submit(merge_range, slices))
+
+        hashes, offsets = array('Q'), array('Q')
+        for future in merges:
+            hashes.frombytes(future.result()[0])
+            offsets.frombytes(future.result()[1])
+
+    logger.info('merged {} chunks of {} in {:.3f} s'.format(
+        len(bounds), path, timer() - began))
+    return hashes, offsets
+
+
+def write_segment(f, hashes, offsets):
+    f.write(SEGMENT.pack(len(hashes)))
+    hashes.tofile(f)
+    offsets.tofile(f)
+
+
+def write_header(f, segments, data, stat):
+    f.seek(0)
+    f.write(HEADER.pack(
+        MAGIC, VERSION, segments, stat.st_size, stat.st_mtime_ns,
+        *checksums(data, stat.st_size)))
+
+
+def read_header(mapped):
+    """
+    parses the header and segment table of a mapped index file
+
+    Parameters:
+    mapped(bytes): memory mapped index file
+
+    Returns:
+    tuple: header fields and a list of (hashes, offsets) segments, None if
+    the file is not a complete index
+
+    """
+
+    if len(mapped) < HEADER.size:
+        return None
+
+    header = HEADER.unpack_from(mapped)
+    magic, version, count = header[:3]
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    segments = []
+    position = HEADER.size
+    view = memoryview(mapped)
+    for _ in range(count):
+        if position + SEGMENT.size > len(mapped):
+            return None
+        lines, = SEGMENT.unpack_from(mapped, position)
+        position += SEGMENT.size
+
+        end = position + 16 * lines
+        if end > len(mapped):
+            return None
+        column = view[position:end].cast('Q')
+        segments.append((column[:lines], column[lines:]))
+        position = end
+
+    return header, segments, position
+
+
+def hash_file(mfile):
+    """
+    indexes every line of a byte string in memory
+
+    Parameters:
+    mfile(bytes): bytes to be indexed
+
+    Returns:
+    LineIndex: index of the lines of mfile
+
+    """
+
+    logger.debug('started hashing file')
+    index = LineIndex(mfile, [hash_lines(mfile)])
+    logger.debug('file hashed successfully')
+    return index
+
+
+def build_index(path, output, workers=INDEX_WORKERS):
+    """
+    hashes every line of a data file and writes the index in one segment
+
+    Parameters:
+    path(path): path to data file
+    output(path): path of the index file to be written
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    None
+
+    """
+
+    start = timer()
+    data, stat = map_data(path)
+    hashes, offsets = build_segment(path, data, workers=workers)
+
+    # write beside the target and rename so readers never see partial files
+    temp = '{}.{}.tmp'.format(output, os.getpid())
+    with open(temp, 'wb') as f:
+        write_header(f, 1, data, stat)
+        write_segment(f, hashes, offsets)
+    os.replace(temp, output)
+
+    elapsed = timer() - start
+    logger.info('indexed {} lines of {} in {:.3f} s, {:.0f} lines/s'.format(
+        len(hashes), path, elapsed, len(hashes) / max(elapsed, 1e-9)))
+
+
+def append_index(path, output, mapped, workers=INDEX_WORKERS):
+    """
+    indexes only the bytes appended to a data file since the index was
+    written, as a new segment at the end of the index file
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to index file
+    mapped(bytes): memory mapped index file
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    bool: 'True' if the tail was indexed and 'False' if the data file was
+    truncated or rewritten and needs a full rebuild
+
+    """
+
+    parsed = read_header(mapped)
+    if parsed is None:
+        return False
+
+    header, segments, end = parsed
+    size = header[3]
+    data, stat = map_data(path)
+
+    if (stat.st_size <= size or len(segments) >= INDEX_MAX_SEGMENTS
+            or checksums(data, size) != header[5:]):
+        return False
+
+    start = timer()
+
+    # the last indexed line may have been incomplete, index it again
+    tail = data.rfind(LINE_END, 0, size) + 1
+    hashes, offsets = build_segment(path, data, tail, workers=workers)
+
+    with open(output, 'r+b') as f:
+        # drop whatever an interrupted append left behind
+        f.truncate(end)
+        f.seek(end)
+        write_segment(f, hashes, offsets)
+        f.flush()
+        os.fsync(f.fileno())
+        write_header(f, len(segments) + 1, data, stat)
+
+    logger.info('indexed {} appended lines of {} in {:.3f} s'.format(
+        len(hashes), path, timer() - start))
+    return True
+
+
+def map_index(output):
+    """
+    maps an index file read only
+
+    Parameters:
+    output(path): path to index file
+
+    Returns:
+    mmap: memory mapped index file, None if missing or empty
+
+    """
+
+    try:
+        f = open(output, 'rb')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+
+
+def open_index(path, output):
+    """
+    maps an index file if it is up to date with its data file
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to index file
+
+    Returns:
+    LineIndex: index, None if missing or stale
+
+    """
+
+    mapped = map_index(output)
+    if mapped is None:
+        return None
+
+    # candidates are read from the descriptor, which may shrink under it
+    parsed = read_header(mapped)
+    data = DataFile(path)
+    stat = data.fstat()
+    if (parsed is None or parsed[0][3] != stat.st_size
+            or parsed[0][4] != stat.st_mtime_ns):
+        logger.info('index {} is stale'.format(output))
+        return None
+
+    return LineIndex(data, parsed[1])
+
+
+def update_index(path, output, workers=INDEX_WORKERS):
+    """
+    brings a stale index file up to date, indexing only the appended tail
+    when the data file grew and rebuilding it otherwise
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to index file
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    None
+
+    """
+
+    mapped = map_index(output)
+    if mapped is not None and append_index(path, output, mapped, workers):
+        return
+
+    build_index(path, output, workers)
+
+
+def load_index(path, output=None, workers=INDEX_WORKERS):
+    """
+    loads the index of a data file, updating it only when stale
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to index file, defaults to beside the data file
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    LineIndex: index of the data file
+
+    """
+
+    output = output or index_path(path)
+
+    index = open_index(path, output)
+    if index is None:
+        # one process updates while the others wait and map its result
+        with file_lock(output):
+            index = open_index(path, output)
+            if index is None:
+                update_index(path, output, workers)
+                index = open_index(path, output)
+
+    logger.debug('loaded index {} with {} lines'.format(output, len(index)))
+    return index
+
+
+def index_file(path, output=None, persist=PERSIST_INDEX):
+    """
+    builds a new index of a data file without touching the current one
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to index file, defaults to beside the data file
+    persist(bool): 'True' to use the index file, 'False' to hash in memory
+
+    Returns:
+    LineIndex: index of the data file
+
+    """
+
+    if persist:
+        return load_index(path, output)
+
+    data = DataFile(path)
+    return LineIndex(data, [hash_data(data)])
+
+
+def hash_data(data):
+    """
+    hashes the lines of an open data file in memory
+
+    Parameters:
+    data(DataFile): data file to be hashed
+
+    Returns:
+    tuple: arrays of sorted hashes and of the offsets of their lines
+
+    """
+
+    # the mapping is only read while hashing, lookups read the descriptor
+    size = data.fstat().st_size
+    if size == 0:
+        return hash_lines(b'')
+
+    mapped = mmap.mmap(data.fd, size, prot=mmap.PROT_READ)
+    segment = hash_lines(mapped)
+    close_map(mapped)
+    return segment
+
+
+def hash_shard(path):
+    """
+    hashes the lines of a shard in memory in a builder process, which sends
+    the segment back as the index is not persisted
+
+    Parameters:
+    path(path): path to data file
+
+    Returns:
+    tuple: arrays of sorted hashes and of the offsets of their lines
+
+    """
+
+    return hash_data(DataFile(path))
+
+
+def build_shard(path):
+    """
+    brings the index file of a shard up to date in a builder process,
+    hashing the file serially as the shards are already spread over the pool
+
+    Parameters:
+    path(path): path to data file
+
+    Returns:
+    None
+
+    """
+
+    load_index(path, workers=1)
+
+
+def load_shards(paths, previous=None, persist=PERSIST_INDEX,
+                workers=INDEX_WORKERS):
+    """
+    indexes every data file of a dataset as its own shard, keeping the
+    shards of previous whose file did not change and updating the index
+    files of the others in parallel
+
+    Parameters:
+    paths(list): paths to data files
+    previous(ShardedIndex): index of an earlier version of the dataset
+    persist(bool): 'True' to use index files, 'False' to hash in memory
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    ShardedIndex: index of the dataset
+
+    """
+
+    start = timer()
+    kept = previous.shards if isinstance(previous, ShardedIndex) else {}
+    shards = {}
+    changed = []
+    for path in paths:
+        key = file_key(path)
+        if key is None:
+            continue
+        if path in kept and kept[path][0] == key:
+            shards[path] = kept[path]
+        else:
+            changed.append((path, key))
+
+    # mapping an up to date index file is cheap, only building them is not,
+    # shards hashed in memory are sent back by the builders
+    workers = min(len(changed), workers or os.cpu_count() or 1)
+    segments = {}
+    if workers > 1:
+        build = build_shard if persist else hash_shard
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = {pool.submit(build, path): path for path, _ in changed}
+            for future in as_completed(futures):
+                try:
+                    segments[futures[future]] = future.result()
+                except FileNotFoundError:
+                    pass
+
+    for path, key in changed:
+        try:
+            if segments.get(path) is not None:
+                index = LineIndex(DataFile(path), [segments[path]])
+            else:
+                index = index_file(path, persist=persist)
+            shards[path] = key, index
+        except FileNotFoundError:
+            logger.warning('{} was removed while indexing'.format(path))
+
+    logger.info('indexed {} changed of {} data files in {:.3f} s'.format(
+        len(changed), len(paths), timer() - start))
+    return ShardedIndex({path: shards[path] for path in paths
+                         if path in shards})
+
+
+def index_dataset(paths, output=None, previous=None, persist=PERSIST_INDEX):
+    """
+    indexes the data files of a dataset, a single file as a whole and
+    several files as one shard each
+
+    Parameters:
+    paths(list): paths to data files
+    output(path): path to index file of a single data file
+    previous(ShardedIndex): index of an earlier version of the dataset
+    persist(bool): 'True' to use index files, 'False' to hash in memory
+
+    Returns:
+    LineIndex: index of the dataset, a ShardedIndex for several files
+
+    """
+
+    if len(paths) == 1:
+        return index_file(paths[0], output, persist)
+
+    return load_shards(paths, previous, persist)
+
+
+def reload_dataset(paths, output=None):
+    """
+    re-indexes the data files of a dataset that changed and swaps the new
+    index in once it is ready, lookups keep using the previous one meanwhile
+
+    Parameters:
+    paths(list): paths to data files
+    output(path): path to index file of a single data file
+
+    Returns:
+    None
+
+    """
+
+    set_index(index_dataset(paths, output, get_index()))
+    logger.info('index of {} data files swapped'.format(len(paths)))
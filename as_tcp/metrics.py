@@ -0,0 +1,246 @@
+import asyncio
+from bisect import bisect_left
+import os
+import resource
+
+# Project Modules
+from .bloom import get_bloom
+from .cache import RESULT_CACHE
+from .index import get_index
+from .prefix import get_sorted
+from .setup import logger
+
+# latency bucket bounds in seconds, two per power of two from 1 us to ~67 s
+BUCKETS = [1e-6 * 2 ** (step / 2) for step in range(53)]
+
+HTTP_RESPONSE = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/plain; version=0.0.4\r\n'
+    'Content-Length: {}\r\n'
+    'Connection: close\r\n'
+    '\r\n')
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, cheap enough to update on
+    every query
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def quantile(self, fraction):
+        """
+        estimates a quantile as the upper bound of the bucket holding it
+
+        Parameters:
+        fraction(float): quantile between 0 and 1
+
+        Returns:
+        float: latency in seconds, 0 if nothing was observed
+
+        """
+
+        wanted = fraction * sum(self.counts)
+        seen = 0
+        for bound, count in zip(BUCKETS + [float('inf')], self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return bound
+        return 0.0
+
+
+class Metrics:
+    """
+    Counters and latency histograms of this process
+    """
+
+    COUNTERS = (
+        ('queries', 'queries answered'),
+        ('hits', 'queries found in the file'),
+        ('misses', 'queries not found in the file'),
+        ('errors', 'queries answered with an internal error'),
+        ('overflows', 'queries over the maximum payload size'),
+        ('connections', 'connections accepted'),
+        ('rejected', 'connections refused over the maximum'),
+        ('timeouts', 'connections closed for idling'),
+        ('bytes_in', 'bytes received'),
+        ('bytes_out', 'bytes sent'),
+    )
+
+    def __init__(self):
+        for name, _ in self.COUNTERS:
+            setattr(self, name, 0)
+        self.open_connections = 0
+        self.latency = {}
+
+    def observe(self, mode, seconds):
+        """
+        records the latency of a lookup
+
+        Parameters:
+        mode(string): lookup mode, such as hash or reread
+        seconds(float): time taken by the lookup
+
+        Returns:
+        None
+
+        """
+
+        histogram = self.latency.get(mode)
+        if histogram is None:
+            histogram = self.latency[mode] = Histogram()
+        histogram.observe(seconds)
+
+    def render(self):
+        """
+        formats every metric in the prometheus text format
+
+        Returns:
+        string: metrics of this process
+
+        """
+
+        pid = 'pid="{}"'.format(os.getpid())
+        lines = []
+
+        counters = [(name, help_text, getattr(self, name))
+                    for name, help_text in self.COUNTERS]
+        counters.extend(cache_stats())
+        for name, help_text, value in counters:
+            lines.append('# HELP as_tcp_{}_total {}'.format(name, help_text))
+            lines.append('# TYPE as_tcp_{}_total counter'.format(name))
+            lines.append('as_tcp_{}_total{{{}}} {}'.format(name, pid, value))
+
+        gauges = [
+            ('open_connections', 'connections currently open',
+             self.open_connections),
+            ('max_rss_bytes', 'peak resident memory of the process',
+             resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+            ('cache_entries', 'REREAD results cached', len(RESULT_CACHE)),
+        ]
+        gauges.extend(index_stats())
+        for name, help_text, value in gauges:
+            lines.append('# HELP as_tcp_{} {}'.format(name, help_text))
+            lines.append('# TYPE as_tcp_{} gauge'.format(name))
+            lines.append('as_tcp_{}{{{}}} {}'.format(name, pid, value))
+
+        lines.append('# HELP as_tcp_lookup_seconds latency of lookups')
+        lines.append('# TYPE as_tcp_lookup_seconds histogram')
+        for mode, histogram in sorted(self.latency.items()):
+            labels = '{},mode="{}"'.format(pid, mode)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append('as_tcp_lookup_seconds_bucket{{{},le="{:.6g}"}} '
+                             '{}'.format(labels, bound, cumulative))
+            cumulative += histogram.counts[-1]
+            lines.append('as_tcp_lookup_seconds_bucket{{{},le="+Inf"}} '
+                         '{}'.format(labels, cumulative))
+            lines.append('as_tcp_lookup_seconds_sum{{{}}} {}'.format(
+                labels, histogram.total))
+            lines.append('as_tcp_lookup_seconds_count{{{}}} {}'.format(
+                labels, cumulative))
+
+        return '\n'.join(lines) + '\n'
+
+
+def index_stats():
+    """
+    gets the size and memory footprint of the index and filter in use
+
+    Returns:
+    list: (name, help, value) tuples of gauges
+
+    """
+
+    index = get_index()
+    bloom = get_bloom()
+    sorted_index = get_sorted()
+    return [
+        ('index_lines', 'lines in the hash mode index', len(index)),
+        ('index_bytes', 'bytes of line hashes and offsets in the index',
+         16 * len(index)),
+        ('bloom_bytes', 'bytes of the bloom filter',
+         0 if bloom is None else bloom.bits // 8),
+        ('sorted_lines', 'distinct lines in the sorted index',
+         0 if sorted_index is None else len(sorted_index)),
+    ]
+
+
+def cache_stats():
+    """
+    gets the counters of the REREAD result cache
+
+    Returns:
+    list: (name, help, value) tuples of counters
+
+    """
+
+    return [
+        ('cache_hits', 'REREAD lookups answered from the cache',
+         RESULT_CACHE.hits),
+        ('cache_misses', 'REREAD lookups missing from the cache',
+         RESULT_CACHE.misses),
+        ('cache_evictions', 'least recently used results evicted',
+         RESULT_CACHE.evictions),
+        ('cache_invalidations', 'times the data file changed under the cache',
+         RESULT_CACHE.invalidations),
+    ]
+
+
+# metrics of this process
+METRICS = Metrics()
+
+
+async def handle_http(reader, writer):
+    """
+    answers any HTTP request with the metrics of this process
+
+    Parameters:
+    reader(StreamReader): request stream
+    writer(StreamWriter): response stream
+
+    Returns:
+    None
+
+    """
+
+    try:
+        # skip the request line and headers
+        while (await reader.readline()).strip():
+            pass
+
+        body = METRICS.render().encode()
+        writer.write(HTTP_RESPONSE.format(len(body)).encode() + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(ip_address, port, reuse_port=False):
+    """
+    starts the HTTP server exposing the metrics
+
+    Parameters:
+    ip_address(string): IP Address to serve the metrics on
+    port(int): Port where metrics will be served
+    reuse_port(bool): bind with SO_REUSEPORT
+
+    Returns:
+    Server: listening server
+
+    """
+
+    server = await asyncio.start_server(
+        handle_http, ip_address, port, reuse_port=reuse_port or None)
+    logger.info('Serving metrics on {}'.format((ip_address, port)))
+    return server
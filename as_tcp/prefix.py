@@ -0,0 +1,397 @@
+from array import array
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import heapq
+import multiprocessing
+import os
+import struct
+from timeit import default_timer as timer
+
+# Project Modules
+from .index import (
+    chunk_bounds, checksums, DataFile, iter_lines, map_data, map_index)
+from .setup import (
+    INDEX_CHUNK_BYTES,
+    INDEX_WORKERS,
+    LINE_END,
+    logger
+)
+from .util import file_lock
+
+# magic, version, number of lines, indexed data size, data mtime in ns,
+# checksums of the first and the last indexed bytes
+HEADER = struct.Struct('<8sIQQqII')
+MAGIC = b'ASTCPSRT'
+VERSION = 1
+SORTED_SUFFIX = '.sidx'
+
+
+def get_sorted():
+    """
+    gets the sorted index serving prefix queries
+
+    Returns:
+    SortedIndex: current sorted index, None if prefix queries are disabled
+
+    """
+
+    return _sorted
+
+
+def set_sorted(index):
+    """
+    replaces the sorted index serving prefix queries
+
+    Parameters:
+    index(SortedIndex): sorted index to be used by subsequent queries
+
+    Returns:
+    None
+
+    """
+
+    global _sorted
+    _sorted = index
+
+
+def sorted_path(path):
+    """
+    gets the path of the sorted index kept beside a data file
+
+    Parameters:
+    path(path): path to data file
+
+    Returns:
+    string: path to sorted index file
+
+    """
+
+    return '{}{}'.format(path, SORTED_SUFFIX)
+
+
+def read_line(data, offset):
+    """
+    reads the stripped line starting at offset
+
+    Parameters:
+    data(bytes): memory mapped data file
+    offset(int): offset of the line in the data file
+
+    Returns:
+    bytes: stripped line
+
+    """
+
+    end = data.find(LINE_END, offset)
+    if end < 0:
+        end = len(data)
+    return data[offset:end].strip()
+
+
+def successor(prefix):
+    """
+    gets the smallest byte string greater than every string starting with
+    prefix
+
+    Parameters:
+    prefix(bytes): prefix
+
+    Returns:
+    bytes: upper bound of the prefix, None if there is none
+
+    """
+
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class SortedIndex:
+    """
+    Read only list of the distinct lines of a data file in byte order,
+    stored as the offsets of the lines, which are read with pread
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, line):
+        position = self.lower_bound(line)
+        return (position < len(self.offsets)
+                and self.data.line_at(self.offsets[position]) == line)
+
+    def lower_bound(self, value):
+        """
+        finds the position of the first line not less than value
+
+        Parameters:
+        value(bytes): stripped line or prefix
+
+        Returns:
+        int: position in the sorted lines
+
+        """
+
+        data, offsets = self.data, self.offsets
+        low, high = 0, len(offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if data.line_at(offsets[middle]) < value:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def prefix_range(self, prefix):
+        """
+        finds the positions of the lines starting with prefix
+
+        Parameters:
+        prefix(bytes): prefix
+
+        Returns:
+        tuple: first position and the position after the last one
+
+        """
+
+        upper = successor(prefix)
+        end = len(self.offsets) if upper is None else self.lower_bound(upper)
+        return self.lower_bound(prefix), end
+
+    def count(self, prefix):
+        start, end = self.prefix_range(prefix)
+        return end - start
+
+    def prefix(self, prefix, limit, cursor=0):
+        """
+        gets a page of the lines starting with prefix
+
+        Parameters:
+        prefix(bytes): prefix
+        limit(int): largest number of lines returned
+        cursor(int): number of matching lines already returned
+
+        Returns:
+        tuple: list of lines and the cursor of the next page, None if
+        there is none
+
+        """
+
+        start, end = self.prefix_range(prefix)
+        begin = min(start + cursor, end)
+        stop = min(begin + limit, end)
+
+        data = self.data
+        lines = [data.line_at(offset)
+                 for offset in self.offsets[begin:stop]]
+        return lines, stop - start if stop < end else None
+
+
+def sort_lines(data, start=0, end=None):
+    """
+    sorts the distinct lines of a buffer
+
+    Parameters:
+    data(bytes): buffer to be sorted
+    start(int): offset of the first line
+    end(int): offset where sorting stops, defaults to end of buffer
+
+    Returns:
+    array: offsets of the distinct lines in byte order of the lines
+
+    """
+
+    offsets = array('Q')
+    previous = None
+    for line, offset in sorted(
+            (line, offset) for offset, line in iter_lines(data, start, end)):
+        if line != previous:
+            offsets.append(offset)
+            previous = line
+
+    return offsets
+
+
+def sort_chunk(path, start, end):
+    """
+    sorts a chunk of a data file in a builder process
+
+    Parameters:
+    path(path): path to data file
+    start(int): offset of the chunk
+    end(int): end of the chunk
+
+    Returns:
+    bytes: sorted offsets of the chunk
+
+    """
+
+    data, _ = map_data(path)
+    return sort_lines(data, start, end).tobytes()
+
+
+def merge_runs(data, runs):
+    """
+    merges sorted runs of offsets, dropping lines found in several runs
+
+    Parameters:
+    data(bytes): memory mapped data file
+    runs(list): arrays of sorted offsets
+
+    Returns:
+    array: offsets of the distinct lines in byte order of the lines
+
+    """
+
+    if len(runs) == 1:
+        return runs[0]
+
+    def keyed(run):
+        for offset in run:
+            yield read_line(data, offset), offset
+
+    offsets = array('Q')
+    previous = None
+    for line, offset in heapq.merge(*map(keyed, runs)):
+        if line != previous:
+            offsets.append(offset)
+            previous = line
+
+    return offsets
+
+
+def build_sorted(path, output, chunk_bytes=INDEX_CHUNK_BYTES,
+                 workers=INDEX_WORKERS):
+    """
+    sorts the lines of a data file, spreading newline aligned chunks over a
+    pool of builder processes, and writes the sorted index
+
+    Parameters:
+    path(path): path to data file
+    output(path): path of the sorted index file to be written
+    chunk_bytes(int): approximate size of the chunk sorted by one task
+    workers(int): number of builder processes, 0 means one per cpu core
+
+    Returns:
+    None
+
+    """
+
+    start = timer()
+    data, stat = map_data(path)
+    bounds = chunk_bounds(data, 0, len(data), chunk_bytes)
+    workers = min(len(bounds), workers or os.cpu_count() or 1)
+
+    if workers <= 1:
+        runs = [sort_lines(data)]
+    else:
+        # spawn, the builder may run beside the event loop and watcher threads
+        context = multiprocessing.get_context('spawn')
+        runs = []
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = [pool.submit(sort_chunk, path, *bound)
+                       for bound in bounds]
+            for future in as_completed(futures):
+                run = array('Q')
+                run.frombytes(future.result())
+                runs.append(run)
+
+    offsets = merge_runs(data, runs)
+
+    # write beside the target and rename so readers never see partial files
+    temp = '{}.{}.tmp'.format(output, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, len(offsets), stat.st_size, stat.st_mtime_ns,
+            *checksums(data, stat.st_size)))
+        offsets.tofile(f)
+    os.replace(temp, output)
+
+    logger.info('sorted {} lines of {} in {:.3f} s'.format(
+        len(offsets), path, timer() - start))
+
+
+def open_sorted(path, output):
+    """
+    maps a sorted index file if it is up to date with its data file
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to sorted index file
+
+    Returns:
+    SortedIndex: sorted index, None if missing or stale
+
+    """
+
+    mapped = map_index(output)
+    if mapped is None or len(mapped) < HEADER.size:
+        return None
+
+    magic, version, count, size, mtime, _, _ = HEADER.unpack_from(mapped)
+    data = DataFile(path)
+    stat = data.fstat()
+    if (magic != MAGIC or version != VERSION
+            or len(mapped) < HEADER.size + 8 * count
+            or size != stat.st_size or mtime != stat.st_mtime_ns):
+        logger.info('sorted index {} is stale'.format(output))
+        return None
+
+    offsets = memoryview(mapped)[HEADER.size:HEADER.size + 8 * count]
+    return SortedIndex(data, offsets.cast('Q'))
+
+
+def load_sorted(path, output=None):
+    """
+    loads the sorted index of a data file, rebuilding it only when stale
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to sorted index file, defaults to beside the data file
+
+    Returns:
+    SortedIndex: sorted index of the data file
+
+    """
+
+    output = output or sorted_path(path)
+
+    index = open_sorted(path, output)
+    if index is None:
+        # one process rebuilds while the others wait and map its result
+        with file_lock(output):
+            index = open_sorted(path, output)
+            if index is None:
+                build_sorted(path, output)
+                index = open_sorted(path, output)
+
+    logger.debug('loaded sorted index {} with {} lines'.format(
+        output, len(index)))
+    return index
+
+
+def reload_sorted(path, output=None):
+    """
+    rebuilds the sorted index of a data file and swaps it in once it is
+    ready, prefix queries keep using the previous one meanwhile
+
+    Parameters:
+    path(path): path to data file
+    output(path): path to sorted index file, defaults to beside the data file
+
+    Returns:
+    None
+
+    """
+
+    set_sorted(load_sorted(path, output))
+    logger.info('sorted index of {} swapped'.format(path))
+
+
+# sorted index currently serving prefix queries, None while disabled
+_sorted = None
@@ -0,0 +1,456 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import re
+import threading
+
+# Project Modules
+from .index import chunk_bounds
+from .setup import (
+    logger,
+    LINE_END,
+    SCAN_BATCH_SIZE,
+    SCAN_BATCH_WINDOW,
+    SCAN_EXECUTOR,
+    SCAN_SEGMENT_BYTES,
+    SCAN_WORKERS
+)
+from .util import MappedFile
+
+# bytes searched between chances for other threads to take the GIL,
+# mmap.find holds it for the whole search
+SLICE_BYTES = 4 * 1024 * 1024
+
+# whitespace bytes.strip removes, except the line terminator
+STRIPPED = rb'[ \t\r\x0b\x0c]*'
+
+# batches of fewer queries are searched for one at a time, a substring search
+# per query beats splitting the segment into lines below about 6 of them
+FIND_QUERIES = 6
+
+# mappings of the scanning thread, so no thread closes a map another one
+# is still searching
+_local = threading.local()
+
+
+def mapped_file(path):
+    """
+    gets the mapping of a file owned by the calling thread
+
+    Parameters:
+    path(path): path to file
+
+    Returns:
+    MappedFile: mapping of the file
+
+    """
+
+    files = getattr(_local, 'files', None)
+    if files is None:
+        files = _local.files = {}
+
+    if path not in files:
+        files[path] = MappedFile(path)
+    return files[path]
+
+
+def find_in(data, pattern, start=0, end=None):
+    """
+    finds a pattern a slice at a time
+
+    Parameters:
+    data(bytes): buffer to be searched
+    pattern(bytes): bytes to be found
+    start(int): offset where the search starts
+    end(int): offset where the search stops, defaults to end of buffer
+
+    Returns:
+    int: offset of the first match, -1 if not found
+
+    """
+
+    if end is None:
+        end = len(data)
+
+    while start < end:
+        # overlap slices so a match across their boundary is found
+        stop = min(start + SLICE_BYTES + len(pattern) - 1, end)
+        found = data.find(pattern, start, stop)
+        if found >= 0:
+            return found
+        start += SLICE_BYTES
+
+    return -1
+
+
+def line_pattern(query):
+    """
+    compiles a pattern matching a line equal to a query once stripped
+
+    Parameters:
+    query(bytes): stripped query
+
+    Returns:
+    Pattern: pattern whose first group is the query
+
+    """
+
+    return re.compile(b'(?m)^' + STRIPPED + b'(' + re.escape(query) + b')'
+                      + STRIPPED + b'$')
+
+
+def find_line(data, query, start=0, end=None):
+    """
+    finds a line equal to a query once stripped, the same match hash mode
+    makes. A substring search finds the first candidate, once a candidate
+    is rejected the query is common and the rest of the buffer is searched
+    with a line anchored pattern
+
+    Parameters:
+    data(bytes): buffer to be searched
+    query(bytes): stripped query
+    start(int): offset where the search starts, must start a line
+    end(int): offset where the search stops, defaults to end of buffer
+
+    Returns:
+    int: offset of the query in the matching line, -1 if not found
+
+    """
+
+    if end is None:
+        end = len(data)
+
+    # a query spanning lines is never a line of the file
+    if not query or LINE_END in query:
+        return -1
+
+    found = find_in(data, query, start, end)
+    if found < 0:
+        return -1
+
+    # only whitespace may surround the query within its line
+    line_start = data.rfind(LINE_END, start, found) + 1 or start
+    line_end = data.find(LINE_END, found + len(query), end)
+    if line_end < 0:
+        line_end = end
+
+    if (not data[line_start:found].strip()
+            and not data[found + len(query):line_end].strip()):
+        return found
+
+    pattern = line_pattern(query)
+    for block_start, block_end in chunk_bounds(
+            data, line_end + 1, end, SLICE_BYTES):
+        match = pattern.search(data, block_start, block_end)
+        if match:
+            return match.start(1)
+
+    return -1
+
+
+def scan_segment(path, query, start=0, end=-1):
+    """
+    looks a query up in a segment of a file, run by the scan executor
+
+    Parameters:
+    path(path): path to file
+    query(bytes): stripped query
+    start(int): offset of the segment
+    end(int): end of the segment, -1 for the end of the file
+
+    Returns:
+    int: offset of the query, -1 if not found
+
+    """
+
+    data = mapped_file(path).get()
+    return find_line(data, query, start, end if end >= 0 else None)
+
+
+def scan_lines(path, queries, start=0, end=-1):
+    """
+    looks several queries up in one pass over a segment of a file, run by
+    the scan executor
+
+    Parameters:
+    path(path): path to file
+    queries(list): stripped queries
+    start(int): offset of the segment
+    end(int): end of the segment, -1 for the end of the file
+
+    Returns:
+    list: queries equal to a stripped line of the segment
+
+    """
+
+    data = mapped_file(path).get()
+    if end < 0:
+        end = len(data)
+
+    wanted = set(queries)
+    if len(wanted) < FIND_QUERIES:
+        return [query for query in wanted
+                if find_line(data, query, start, end) >= 0]
+
+    found = set()
+    for block_start, block_end in chunk_bounds(data, start, end, SLICE_BYTES):
+        lines = data[block_start:block_end].split(LINE_END)
+        found.update(wanted.intersection(map(bytes.strip, lines)))
+        if len(found) == len(wanted):
+            break
+
+    return list(found)
+
+
+class Scanner:
+    """
+    Runs REREAD lookups in a thread or process pool so a long scan does not
+    block the event loop
+    """
+
+    def __init__(self, path, kind=SCAN_EXECUTOR, workers=SCAN_WORKERS,
+                 segment_bytes=SCAN_SEGMENT_BYTES,
+                 batch_window=SCAN_BATCH_WINDOW, batch_size=SCAN_BATCH_SIZE):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.bounds = []
+        self.key = None
+
+        # queries waiting for the next batch and futures of queries in flight
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.queue = []
+        self.inflight = {}
+        self.timer = None
+
+        self.kind = kind
+        self.workers = workers or None
+        self.executor = self.start_executor()
+        logger.debug('scanning {} in a {} pool'.format(path, kind))
+
+    def start_executor(self):
+        """
+        starts the pool running the scans
+
+        Returns:
+        Executor: thread or process pool
+
+        """
+
+        if self.kind == 'process':
+            return ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'))
+        if self.kind == 'thread':
+            return ThreadPoolExecutor(
+                self.workers, thread_name_prefix='scan')
+        raise ValueError('unknown scan executor {!r}'.format(self.kind))
+
+    def segments(self):
+        """
+        splits the file into newline aligned segments scanned in parallel,
+        a line and its terminator never span two segments
+
+        Returns:
+        list: (start, end) tuples, the last one ends at the end of the file
+
+        """
+
+        mapped = mapped_file(self.path)
+        data = mapped.get()
+        if mapped.key != self.key:
+            self.bounds = chunk_bounds(data, 0, len(data), self.segment_bytes)
+            self.key = mapped.key
+
+        return self.bounds
+
+    async def find(self, query):
+        """
+        looks a query up in the file without blocking the event loop,
+        queries arriving within the batch window share one scan
+
+        Parameters:
+        query(bytes): stripped query
+
+        Returns:
+        int: -1 if not found
+
+        """
+
+        # identical queries in flight share one result
+        future = self.inflight.get(query)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.inflight[query] = loop.create_future()
+            future.add_done_callback(
+                lambda _: self.inflight.pop(query, None))
+
+            self.queue.append(query)
+            if len(self.queue) >= self.batch_size:
+                self.dispatch()
+            elif self.timer is None:
+                self.timer = loop.call_later(self.batch_window, self.dispatch)
+
+        # one waiter going away must not cancel the others
+        return await asyncio.shield(future)
+
+    def dispatch(self):
+        """
+        starts scanning for the queued queries
+
+        Returns:
+        None
+
+        """
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        queries, self.queue = self.queue, []
+        if queries:
+            asyncio.ensure_future(self.run_batch(queries))
+
+    async def run_batch(self, queries):
+        """
+        scans the file once for a batch of queries and resolves their futures
+
+        Parameters:
+        queries(list): stripped queries
+
+        Returns:
+        None
+
+        """
+
+        try:
+            if len(queries) == 1:
+                results = {queries[0]: await self.find_one(queries[0])}
+            else:
+                found = await self.find_many(queries)
+                results = {query: 1 if query in found else -1
+                           for query in queries}
+        except Exception as err:
+            results = None
+            error = err
+
+        for query in queries:
+            future = self.inflight.get(query)
+            if future is None or future.done():
+                continue
+            if results is None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[query])
+
+    async def scan_segments(self, function, args, finished):
+        """
+        runs a function over every segment in parallel, until all of them
+        completed or one result finishes the scan
+
+        Parameters:
+        function(function): called with path, args, start and end of a segment
+        args(tuple): arguments passed after the path
+        finished(function): called with each result, 'True' stops the scan
+
+        Returns:
+        None
+
+        """
+
+        executor = self.executor
+        try:
+            await self.run_segments(executor, function, args, finished)
+        except BrokenProcessPool:
+            # a scan process died, killed when out of memory or by SIGBUS
+            # when the file was truncated under it, and took the pool along.
+            # Scans failing at the same time start one new pool
+            if self.executor is executor:
+                logger.error('scan pool of {} broken, restarting'.format(
+                    self.path))
+                executor.shutdown(wait=False)
+                self.executor = self.start_executor()
+            await self.run_segments(self.executor, function, args, finished)
+
+    async def run_segments(self, executor, function, args, finished):
+        """
+        runs a function over every segment in a pool
+
+        Parameters:
+        executor(Executor): pool running the function
+        function(function): called with path, args, start and end of a segment
+        args(tuple): arguments passed after the path
+        finished(function): called with each result, 'True' stops the scan
+
+        Returns:
+        None
+
+        """
+
+        loop = asyncio.get_running_loop()
+        bounds = self.segments()
+        if not bounds:
+            return
+
+        # the last segment also covers whatever was appended since
+        futures = [
+            loop.run_in_executor(
+                executor, function, self.path, *args, start, end)
+            for start, end in bounds[:-1]]
+        futures.append(loop.run_in_executor(
+            executor, function, self.path, *args, bounds[-1][0], -1))
+
+        try:
+            for next_done in asyncio.as_completed(futures):
+                if finished(await next_done):
+                    return
+        finally:
+            # segments not started yet are not needed anymore
+            for future in futures:
+                future.cancel()
+
+    async def find_one(self, query):
+        """
+        looks one query up, scanning the segments in parallel
+
+        Parameters:
+        query(bytes): stripped query
+
+        Returns:
+        int: offset of the query, -1 if not found
+
+        """
+
+        offsets = []
+
+        def finished(offset):
+            if offset >= 0:
+                offsets.append(offset)
+            return bool(offsets)
+
+        await self.scan_segments(scan_segment, (query,), finished)
+        return offsets[0] if offsets else -1
+
+    async def find_many(self, queries):
+        """
+        looks several queries up in a single pass over every segment
+
+        Parameters:
+        queries(list): stripped queries
+
+        Returns:
+        set: queries found in the file
+
+        """
+
+        found = set()
+
+        def finished(lines):
+            found.update(lines)
+            return len(found) == len(queries)
+
+        await self.scan_segments(scan_lines, (queries,), finished)
+        return found
+
+    def close(self, wait=False):
+        self.executor.shutdown(wait=wait)
@@ -1,27 +1,139 @@
 import asyncio
+from collections import deque
 from datetime import datetime
+import logging
+import signal
+import threading
 from timeit import default_timer as timer
 
 # Project Modules
+from .bloom import get_bloom, reload_bloom
+from .cache import RESULT_CACHE
 from .setup import (
     logger,
+    BLOOM_FILTER,
+    BLOOM_PATH,
+    BINARY_PORT,
+    BUSY_RESPONSE,
+    COMMAND_START,
+    DEBUG_RESPONSE,
     DEBUG_START,
+    DRAIN_TIMEOUT,
     ENCODING,
     ERROR_MSG,
     ERROR_START,
-    HASHMAP,
+    data_paths,
     FILEPATH,
+    FOUND_RESPONSE,
+    IDLE_TIMEOUT,
+    INDEX_PATH,
+    LINE_END,
+    LINUXPATH,
+    LISTEN_BACKLOG,
     MAX_BYTE,
+    MAX_CONNECTIONS,
+    MAX_PENDING,
+    MAX_QUERIES,
+    METRICS_PORT,
+    NEW_LINE,
+    NOT_FOUND_RESPONSE,
+    OK_RESPONSE,
     OVERFLOW_MESSAGE,
-    REREAD
+    PREFIX_LIMIT,
+    PREFIX_MAX_LIMIT,
+    READ_TIMEOUT,
+    REREAD,
+    SCAN_EXECUTOR,
+    SORTED_INDEX,
+    SORTED_INDEX_PATH,
+    WATCH_FILE,
+    WRITE_HIGH_WATER,
+    WRITE_LOW_WATER
 )
+from .index import get_index, reload_dataset
+from .metrics import METRICS, serve_metrics
+from .prefix import get_sorted, reload_sorted
+from .scan import find_line, Scanner
+from .sockets import listen_socket, tune_connection
 from .util import (
     add_new_line,
     debug_message,
     default_exception,
     get_message,
-    load_file
+    is_empty,
+    MappedFile,
+    pack_results,
+    RequestParser
 )
+from .watcher import DatasetWatcher
+
+# mapping of the data file shared by every connection in REREAD mode
+MAPPED_FILE = MappedFile(FILEPATH)
+
+# pool running REREAD lookups off the event loop, None scans inline. Started
+# by serve in each worker, the queues of a pool forked along are shared
+SCANNER = None
+
+# connections served by this process, closed as they go idle when draining
+CONNECTIONS = set()
+
+# keeps a reload asked for by SIGHUP from racing one of the watcher
+RELOAD_LOCK = threading.Lock()
+
+# seconds a draining process waits for connections it accepted last
+ACCEPT_GRACE = 0.1
+
+# version of the dataset the lookup structures were loaded from, so workers
+# forked after it changed catch up, None when unknown
+_data_version = None
+
+
+def set_data_version(version):
+    """
+    records the version of the dataset the lookup structures were loaded
+    from, before they are loaded
+
+    Parameters:
+    version(tuple): version of the dataset
+
+    Returns:
+    None
+
+    """
+
+    global _data_version
+    _data_version = version
+
+
+def sorted_index():
+    """
+    gets the sorted index serving PREFIX and COUNT
+
+    Returns:
+    SortedIndex: current sorted index
+
+    """
+
+    index = get_sorted()
+    if index is None:
+        raise ValueError('PREFIX and COUNT need SORTED_INDEX = true')
+    return index
+
+
+def found_lines(results):
+    """
+    renders lookup results as one response line each
+
+    Parameters:
+    results(list): whether each query is in the file
+
+    Returns:
+    bytes: response lines
+
+    """
+
+    return b''.join(
+        FOUND_RESPONSE if found else NOT_FOUND_RESPONSE for found in results)
 
 
 class ServerProtocol(asyncio.Protocol):
@@ -29,11 +141,70 @@ class ServerProtocol(asyncio.Protocol):
     Base Server protocol implementation for as_tcp
     """
 
+    # response of connections over MAX_CONNECTIONS
+    busy_response = BUSY_RESPONSE
+
+    # set on every connection once the process stops serving
+    draining = False
+
     def connection_made(self, transport):
         self.peername = transport.get_extra_info('peername')
-        logger.info('Connection from {}'.format(self.peername))
         self.transport = transport
 
+        # turn connections away early instead of slowing every other one down
+        self.rejected = bool(
+            MAX_CONNECTIONS and METRICS.open_connections >= MAX_CONNECTIONS)
+        if self.rejected:
+            METRICS.rejected += 1
+            logger.debug('Rejected connection from {}'.format(self.peername))
+            transport.write(self.busy_response)
+            transport.close()
+            return
+
+        logger.info('Connection from {}'.format(self.peername))
+        tune_connection(transport)
+        transport.set_write_buffer_limits(WRITE_HIGH_WATER, WRITE_LOW_WATER)
+        self.loop = asyncio.get_running_loop()
+
+        # holds bytes of a query whose line terminator has not arrived yet
+        self.buffer = bytearray()
+
+        # set while skipping the rest of an overflowing query
+        self.discarding = False
+
+        # responses and futures of responses, in the order of their queries
+        self.pending = deque()
+
+        # whether responses carry the debug block
+        self.debug = DEBUG_RESPONSE
+
+        # set once a draining connection sent its last response
+        self.finished = False
+
+        # whether the client sent anything yet
+        self.active = False
+
+        # set while the client reads responses slower than they are written
+        self.writing_paused = False
+        self.reading_paused = False
+
+        # the timeout is checked lazily, activity only moves the time
+        self.last_activity = self.loop.time()
+        self.timeout_handle = None
+
+        # when the unterminated query in the buffer began, None without one
+        self.read_started = None
+        self.schedule_timeout(min(
+            [timeout for timeout in (IDLE_TIMEOUT, READ_TIMEOUT) if timeout],
+            default=0))
+
+        # resolved once the connection is lost, awaited while draining
+        self.closed = self.loop.create_future()
+        CONNECTIONS.add(self)
+
+        METRICS.connections += 1
+        METRICS.open_connections += 1
+
     def get_bytes(self):
         """
         Called to get the memeory mapped file for lookup
@@ -43,30 +214,304 @@ class ServerProtocol(asyncio.Protocol):
 
         """
 
-        return load_file(FILEPATH)
+        return MAPPED_FILE.get()
+
+    def may_contain(self, message):
+        """
+        Called to rule out queries that are definitely not in the file
+
+        Parameters:
+        message(bytes): stripped query
+
+        Returns:
+        bool: 'False' if the query is definitely not in the file
+
+        """
+
+        bloom = get_bloom()
+        if bloom is None:
+            return True
+
+        # a filter of another version of the file may miss new lines
+        if REREAD and bloom.key != self.file_version():
+            return True
+
+        return bloom.may_contain(message)
+
+    def file_version(self):
+        """
+        Called to get the version of the data file REREAD lookups see
+
+        Returns:
+        tuple: device, inode, size and mtime of the data file
+
+        """
+
+        MAPPED_FILE.get()
+        return MAPPED_FILE.key
 
     def data_received(self, data):
+        METRICS.bytes_in += len(data)
+        self.last_activity = self.loop.time()
+        self.active = True
+        if self.finished:
+            return
+        self.buffer += data
+
+        # answer every complete query in the buffer
+        end = self.buffer.rfind(LINE_END)
+        if end >= 0:
+            lines = bytes(self.buffer[:end]).split(LINE_END)
+            del self.buffer[:end + 1]
+
+            for line in lines:
+                if self.discarding:
+                    # tail of a query already answered with an overflow
+                    self.discarding = False
+                    continue
+
+                if is_empty(line.strip()):
+                    continue
+
+                self.pending.append(self.handle_query(line))
+
+        # an unterminated query can not exceed the payload size either
+        if len(self.buffer) > MAX_BYTE:
+            if not self.discarding:
+                self.pending.append(self.handle_query(bytes(self.buffer)))
+            self.buffer.clear()
+            self.discarding = True
+            end = 0
+
+        self.track_read(end >= 0)
+        self.flush()
+
+    def flush(self):
+        """
+        Writes the responses that are ready, stopping at the first query
+        still being looked up so responses keep the order of queries
+
+        Returns:
+        None
+
+        """
+
+        responses = []
+        pending = self.pending
+        while pending:
+            response = pending[0]
+            if isinstance(response, asyncio.Future):
+                if not response.done():
+                    break
+                response = response.result()
+            responses.append(response)
+            pending.popleft()
+
+        if responses and not self.transport.is_closing():
+            self.transport.writelines(responses)
+            METRICS.bytes_out += sum(map(len, responses))
+
+        # every query received is answered, the client can reconnect to
+        # another worker without losing any
+        if self.draining and not pending and not self.buffer:
+            self.finish()
+            return
+
+        self.update_reading()
+
+    def drain(self):
+        """
+        Closes the connection once the queries it already sent are
+        answered, or after answering the first one of a connection that did
+        not send any yet, which is likely on its way
+
+        Returns:
+        None
+
+        """
+
+        self.draining = True
+        if self.active:
+            self.flush()
+
+    def finish(self):
+        """
+        Ends the responses of a draining connection. Only the writing half
+        is closed: the client reads what is left and the end of the stream,
+        and queries crossing it are discarded instead of resetting the
+        connection along with responses the client did not read yet
+
+        Returns:
+        None
+
+        """
+
+        if self.finished or self.transport.is_closing():
+            return
+
+        self.finished = True
+        if self.transport.can_write_eof():
+            self.transport.write_eof()
+        else:
+            self.transport.close()
+
+    def pause_writing(self):
+        self.writing_paused = True
+        self.update_reading()
+
+    def resume_writing(self):
+        self.writing_paused = False
+        self.update_reading()
+
+    def update_reading(self):
+        """
+        Stops reading queries while the client does not read its responses
+        or too many of them are queued, so a connection holds bounded memory
+
+        Returns:
+        None
+
+        """
+
+        paused = self.writing_paused or len(self.pending) >= MAX_PENDING
+        if paused == self.reading_paused or self.transport.is_closing():
+            return
+
+        self.reading_paused = paused
+        if paused:
+            self.transport.pause_reading()
+        else:
+            self.transport.resume_reading()
+
+    def schedule_timeout(self, delay):
+        if delay:
+            self.timeout_handle = self.loop.call_later(
+                delay, self.check_timeout)
+
+    def track_read(self, consumed):
+        """
+        Notes when the unterminated query in the buffer began, checking it
+        READ_TIMEOUT later however long the connection was idle before
+
+        Parameters:
+        consumed(bool): whether complete queries were taken off the buffer
+
+        Returns:
+        None
+
+        """
+
+        if not self.buffer:
+            self.read_started = None
+            return
+
+        if self.read_started is not None and not consumed:
+            return
+
+        self.read_started = self.loop.time()
+        if READ_TIMEOUT:
+            if self.timeout_handle is not None:
+                self.timeout_handle.cancel()
+            self.schedule_timeout(READ_TIMEOUT)
+
+    def check_timeout(self):
+        """
+        Closes the connection once it sent nothing for IDLE_TIMEOUT, or left
+        a query unterminated for READ_TIMEOUT, and checks again otherwise
+
+        Returns:
+        None
+
+        """
+
+        self.timeout_handle = None
+
+        # a query trickling in keeps the connection active, not unterminated
+        if self.buffer and READ_TIMEOUT:
+            timeout = READ_TIMEOUT
+            idle = self.loop.time() - self.read_started
+        else:
+            timeout = IDLE_TIMEOUT
+            idle = self.loop.time() - self.last_activity
+
+        # queries still looked up are waiting on the server, not the client
+        waiting = self.pending and not self.writing_paused
+
+        if timeout and idle >= timeout and not waiting:
+            METRICS.timeouts += 1
+            logger.info('{} timed out after {:.0f} s'.format(
+                self.peername, idle))
+            self.transport.close()
+            return
+
+        if timeout and not waiting:
+            self.schedule_timeout(timeout - idle)
+        else:
+            self.schedule_timeout(READ_TIMEOUT or IDLE_TIMEOUT)
+
+    def handle_query(self, message):
+        """
+        Looks up a single query and builds its response
+
+        Parameters:
+        message(bytes): query without its line terminator
+
+        Returns:
+        bytes: response to be sent to the client, or a future of it when
+        the lookup runs in the scan executor
+
+        """
+
         start = timer()
-        start_time = datetime.now()
 
-        message = data
+        # the wall clock time is only reported in the debug block
+        start_time = datetime.now() if self.debug else None
+
         try:
             # Check for query overflow
             if (len(message) > MAX_BYTE):
+                METRICS.overflows += 1
                 raise ValueError('{} {}'.format(OVERFLOW_MESSAGE, MAX_BYTE))
 
             # removes null and empty characters from string
             message = message.strip()
-            logger.debug('{} Data received: {!r}'.format(
-                self.peername,
-                message.decode(errors='ignore')))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('{} Data received: {!r}'.format(
+                    self.peername,
+                    message.decode(errors='ignore')))
 
-            if REREAD:
-                found_val = self.get_bytes().find(add_new_line(message))
+            if message.startswith(COMMAND_START):
+                # a doubled mark looks up the line starting with one
+                if message.startswith(COMMAND_START, 1):
+                    message = message[1:]
+                else:
+                    return self.handle_command(message[1:])
+
+            if not self.may_contain(message):
+                found = False
+                self.record('bloom', found, start)
+            elif REREAD:
+                key = self.file_version()
+                found = RESULT_CACHE.get(key, message)
+                if found is not None:
+                    self.record('cache', found, start)
+                elif SCANNER is not None:
+                    future = asyncio.ensure_future(
+                        self.scan(message, key, start, start_time))
+                    future.add_done_callback(lambda _: self.flush())
+                    return future
+                else:
+                    found = find_line(self.get_bytes(), message) >= 0
+                    RESULT_CACHE.put(key, message, found)
+                    self.record('reread', found, start)
             else:
-                found_val = HASHMAP[message]
+                found = message in get_index()
+                self.record('hash', found, start)
+
+            if not self.debug:
+                return FOUND_RESPONSE if found else NOT_FOUND_RESPONSE
 
-            res_message = get_message(found_val)
+            res_message = get_message(1 if found else -1)
 
         # handle overflow exeption
         except ValueError as err:
@@ -76,11 +521,317 @@ class ServerProtocol(asyncio.Protocol):
 
         # handle other server errors
         except Exception:
+            METRICS.errors += 1
             res_message = ERROR_MSG
             default_exception()
 
-        finally:
-            # add debug messages to response
+        return self.response(res_message, message, start, start_time)
+
+    def record(self, mode, found, start):
+        """
+        Counts a lookup and its latency in the metrics
+
+        Parameters:
+        mode(string): hash, reread, cache for cached REREAD results or bloom
+            when the filter ruled the query out
+        found(bool): whether the query is in the file
+        start(float): timer value when the query was received
+
+        Returns:
+        None
+
+        """
+
+        METRICS.queries += 1
+        if found:
+            METRICS.hits += 1
+        else:
+            METRICS.misses += 1
+        METRICS.observe(mode, timer() - start)
+
+    def handle_command(self, message):
+        """
+        Runs one of the protocol commands
+
+        Parameters:
+        message(bytes): stripped query without the command mark
+
+        Returns:
+        bytes: response of the command
+
+        """
+
+        name, _, argument = message.partition(b' ')
+        command = self.commands.get(name)
+        if command is None:
+            raise ValueError('unknown command {!r}'.format(
+                name.decode(errors='ignore')))
+
+        return command(self, argument.strip())
+
+    def command_debug(self, argument):
+        """
+        DEBUG ON|OFF switches the debug block of this connection
+
+        Parameters:
+        argument(bytes): ON or OFF
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        if argument not in (b'ON', b'OFF'):
+            raise ValueError('usage: DEBUG ON|OFF')
+
+        self.debug = argument == b'ON'
+        return OK_RESPONSE
+
+    def command_metrics(self, argument):
+        """
+        METRICS returns the metrics of this process in the prometheus text
+        format, ended by a '# EOF' line
+
+        Parameters:
+        argument(bytes): ignored
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        text = METRICS.render() + '# EOF\n'
+        return text.replace('\n', NEW_LINE).encode(ENCODING)
+
+    def command_prefix(self, argument):
+        """
+        PREFIX <prefix> [<limit> [<cursor>]] returns up to limit lines
+        starting with prefix in byte order, one per line, followed by
+        'CURSOR <cursor>' to get the next page with, or 'END'
+
+        Parameters:
+        argument(bytes): prefix, limit and cursor
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        words = argument.split()
+        if (not 1 <= len(words) <= 3
+                or not all(word.isdigit() for word in words[1:])):
+            raise ValueError('usage: PREFIX <prefix> [<limit> [<cursor>]]')
+
+        # an empty page would hand back its own cursor forever
+        limit = int(words[1]) if len(words) > 1 else PREFIX_LIMIT
+        if not 1 <= limit <= PREFIX_MAX_LIMIT:
+            raise ValueError(
+                'limit is between 1 and {}'.format(PREFIX_MAX_LIMIT))
+        cursor = int(words[2]) if len(words) > 2 else 0
+
+        lines, cursor = sorted_index().prefix(words[0], limit, cursor)
+        lines.append(b'END' if cursor is None else b'CURSOR %d' % cursor)
+        return b''.join(map(add_new_line, lines))
+
+    def command_count(self, argument):
+        """
+        COUNT <prefix> returns 'COUNT <n>', the number of distinct lines
+        starting with prefix
+
+        Parameters:
+        argument(bytes): prefix
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        if not argument or len(argument.split()) != 1:
+            raise ValueError('usage: COUNT <prefix>')
+
+        return add_new_line(b'COUNT %d' % sorted_index().count(argument))
+
+    def command_mget(self, argument):
+        """
+        MGET <query> [<query> ...] looks up every query at once and returns
+        one response line per query, in their order
+
+        Parameters:
+        argument(bytes): queries separated by spaces
+
+        Returns:
+        bytes: response to be sent to the client, or a future of it when
+        the lookup runs in the scan executor
+
+        """
+
+        queries = argument.split()
+        if not queries:
+            raise ValueError('usage: MGET <query> [<query> ...]')
+
+        start = timer()
+        if not self.debug:
+            return self.lookup_many(queries, start, found_lines)
+
+        # one debug block for the whole request
+        start_time = datetime.now()
+        message = COMMAND_START + b'MGET ' + argument
+
+        def render(results):
+            res_message = NEW_LINE.join(
+                get_message(1 if found else -1) for found in results)
+            return self.response(res_message, message, start, start_time)
+
+        return self.lookup_many(queries, start, render)
+
+    # protocol commands by name, run by queries starting with COMMAND_START
+    commands = {
+        b'COUNT': command_count,
+        b'DEBUG': command_debug,
+        b'METRICS': command_metrics,
+        b'MGET': command_mget,
+        b'PREFIX': command_prefix,
+    }
+
+    async def scan(self, message, key, start, start_time):
+        """
+        Looks up a query in the scan executor
+
+        Parameters:
+        message(bytes): stripped query
+        key(tuple): version of the data file when the query was received
+        start(float): timer value when the query was received
+        start_time(datetime): time when the query was received
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        try:
+            found = await SCANNER.find(message) >= 0
+            RESULT_CACHE.put(key, message, found)
+            self.record('reread', found, start)
+            if not self.debug:
+                return FOUND_RESPONSE if found else NOT_FOUND_RESPONSE
+
+            res_message = get_message(1 if found else -1)
+
+        # handle server errors
+        except Exception:
+            METRICS.errors += 1
+            res_message = ERROR_MSG
+            default_exception()
+
+        return self.response(res_message, message, start, start_time)
+
+    def lookup_many(self, queries, start, render):
+        """
+        Looks up several queries at once, scanning the file a single time
+        for the ones neither ruled out nor cached in REREAD mode
+
+        Parameters:
+        queries(list): stripped queries
+        start(float): timer value when the queries were received
+        render(function): builds the response from the list of results
+
+        Returns:
+        bytes: response to be sent to the client, or a future of it when
+        the lookup runs in the scan executor
+
+        """
+
+        if not REREAD:
+            index = get_index()
+            return render(self.record_many(
+                [self.may_contain(query) and query in index
+                 for query in queries], start))
+
+        key = self.file_version()
+        results = {
+            query: RESULT_CACHE.get(key, query)
+            if self.may_contain(query) else False
+            for query in set(queries)}
+        wanted = [query for query, found in results.items() if found is None]
+
+        if wanted and SCANNER is not None:
+            future = asyncio.ensure_future(self.scan_many(
+                queries, results, wanted, key, start, render))
+            future.add_done_callback(lambda _: self.flush())
+            return future
+
+        if wanted:
+            data = self.get_bytes()
+            for query in wanted:
+                results[query] = found = find_line(data, query) >= 0
+                RESULT_CACHE.put(key, query, found)
+
+        return render(self.record_many(
+            [results[query] for query in queries], start))
+
+    async def scan_many(self, queries, results, wanted, key, start, render):
+        """
+        Looks up the uncached queries of a request in a single pass of the
+        scan executor
+
+        Parameters:
+        queries(list): stripped queries
+        results(dict): results of the queries, None for the ones wanted
+        wanted(list): distinct queries to be scanned for
+        key(tuple): version of the data file when the request was received
+        start(float): timer value when the request was received
+        render(function): builds the response from the list of results
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        found = await SCANNER.find_many(wanted)
+        for query in wanted:
+            results[query] = query in found
+            RESULT_CACHE.put(key, query, results[query])
+
+        return render(self.record_many(
+            [results[query] for query in queries], start))
+
+    def record_many(self, results, start):
+        """
+        Counts the lookups of a request in the metrics
+
+        Parameters:
+        results(list): whether each query is in the file
+        start(float): timer value when the request was received
+
+        Returns:
+        list: results
+
+        """
+
+        hits = sum(results)
+        METRICS.queries += len(results)
+        METRICS.hits += hits
+        METRICS.misses += len(results) - hits
+        METRICS.observe('batch', timer() - start)
+        return results
+
+    def response(self, res_message, message, start, start_time):
+        """
+        Adds the debug block to a response message if enabled and encodes it
+
+        Parameters:
+        res_message(string): response message
+        message(bytes): query
+        start(float): timer value when the query was received
+        start_time(datetime): time when the query was received
+
+        Returns:
+        bytes: response to be sent to the client
+
+        """
+
+        # add debug messages to response
+        if self.debug:
             res_message += DEBUG_START + debug_message(
                 IP_ADDRESS=self.peername[0],
                 PORT=self.peername[1],
@@ -91,37 +842,260 @@ class ServerProtocol(asyncio.Protocol):
                 END_TIME=datetime.now()
             )
 
-            logger.debug('{} Sending: {!r}'.format(self.peername, res_message))
-            self.transport.write(add_new_line(bytes(res_message, ENCODING)))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('{} Sending: {!r}'.format(
+                self.peername, res_message))
+        return add_new_line(bytes(res_message, ENCODING))
 
     def connection_lost(self, exc):
+        if self.rejected:
+            return
+
         logger.info('{} is disconnnected'.format(self.peername))
+        METRICS.open_connections -= 1
+        CONNECTIONS.discard(self)
+        self.closed.set_result(None)
+
+        if self.timeout_handle is not None:
+            self.timeout_handle.cancel()
+
+        # nobody is left to read the answers of queries still looked up
+        for response in self.pending:
+            if isinstance(response, asyncio.Future):
+                response.cancel()
+        self.pending.clear()
+
         super().connection_lost(exc)
 
 
-async def serve(ip_address, port):
+class BinaryProtocol(ServerProtocol):
+    """
+    Binary protocol: a request is a 4 byte count followed by that many
+    queries, each prefixed by its 2 byte length, all big endian. The
+    response is the count followed by a bitmap of the queries found, the
+    lowest bit of the first byte standing for the first query
+    """
+
+    # binary clients can not parse text, rejected connections are closed
+    busy_response = b''
+
+    def connection_made(self, transport):
+        # a request split over several reads is parsed as it arrives
+        self.parser = RequestParser(MAX_QUERIES)
+        super().connection_made(transport)
+
+    def data_received(self, data):
+        METRICS.bytes_in += len(data)
+        self.last_activity = self.loop.time()
+        self.active = True
+        if self.finished:
+            return
+        self.buffer += data
+
+        position = 0
+        while True:
+            try:
+                request = self.parser.parse(self.buffer, position)
+            except ValueError as err:
+                logger.error('{} {}'.format(self.peername, err))
+                self.transport.close()
+                return
+
+            if request is None:
+                break
+
+            queries, position = request
+            self.pending.append(
+                self.lookup_many(queries, timer(), pack_results))
+
+        del self.buffer[:position]
+        self.track_read(position > 0)
+        self.flush()
+
+
+def reload_data():
+    """
+    rebuilds the lookup structures of the data file after it changed
+
+    Returns:
+    None
+
+    """
+
+    with RELOAD_LOCK:
+        # the filter goes first, next to the old index it only lets misses
+        # through
+        if BLOOM_FILTER:
+            reload_bloom(FILEPATH, BLOOM_PATH)
+
+        if not REREAD:
+            reload_dataset(data_paths(LINUXPATH), INDEX_PATH)
+
+        if SORTED_INDEX:
+            reload_sorted(FILEPATH, SORTED_INDEX_PATH)
+
+
+def reload_on_signal():
+    """
+    reloads the data file when SIGHUP asks for it, off the event loop
+
+    Returns:
+    None
+
+    """
+
+    logger.info('SIGHUP received, reloading {}'.format(LINUXPATH))
+    try:
+        reload_data()
+    except Exception:
+        default_exception()
+
+
+async def drain(servers, timeout=DRAIN_TIMEOUT):
+    """
+    Stops accepting connections and waits for the open ones to get the
+    answers of the queries they sent, closing the rest after timeout
+
+    Parameters:
+    servers(list): servers to stop
+    timeout(float): seconds to wait for connections, 0 waits for all of them
+
+    Returns:
+    None
+
+    """
+
+    # stop accepting before closing: asyncio hands accepted connections to
+    # their protocol a few loop iterations later, and drops the ones still
+    # on their way when their server is closed
+    loop = asyncio.get_running_loop()
+    for server in servers:
+        for sock in server.sockets:
+            loop.remove_reader(sock.fileno())
+    await asyncio.sleep(ACCEPT_GRACE)
+
+    for server in servers:
+        server.close()
+
+    logger.info('Draining {} connections'.format(len(CONNECTIONS)))
+
+    # connections accepted from now on are drained after their first answer
+    ServerProtocol.draining = True
+    for connection in list(CONNECTIONS):
+        connection.drain()
+
+    deadline = loop.time() + timeout
+    while CONNECTIONS:
+        remaining = deadline - loop.time() if timeout else None
+        if remaining is not None and remaining <= 0:
+            logger.warning('Closing {} connections still open after {} s'
+                           .format(len(CONNECTIONS), timeout))
+            break
+
+        await asyncio.wait(
+            [connection.closed for connection in CONNECTIONS],
+            timeout=remaining)
+
+    for connection in list(CONNECTIONS):
+        connection.transport.abort()
+
+
+async def start_server(protocol, ip_address, port, sock, reuse_port):
     """
-    Starts and serves the asynchronous server
+    Creates a server for a protocol on a port or an inherited socket
+
+    Parameters:
+    protocol(class): protocol serving each connection
+    ip_address(string): IP Address to serve the server
+    port(int): Port where server will be served
+    sock(socket): already listening socket to serve instead of binding
+    reuse_port(bool): bind with SO_REUSEPORT
+
+    Returns:
+    Server: listening server
+
+    """
+
+    # bound here so the backlog and buffer sizes are set before listening
+    if sock is None:
+        sock = listen_socket(ip_address, port, reuse_port)
+
+    # asyncio listens again on the socket, with a backlog of its own
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(
+        protocol, sock=sock, backlog=LISTEN_BACKLOG)
+
+
+async def serve(ip_address, port, sock=None, reuse_port=False,
+                binary_port=BINARY_PORT, binary_sock=None,
+                metrics_port=METRICS_PORT, ready=None):
+    """
+    Starts and serves the asynchronous server until SIGQUIT drains it,
+    SIGHUP reloads the data file in the background
 
     Parameters:
     ip_address(string): IP Address to server the server
     port(int): Port where server will be served
+    sock(socket): already listening socket to serve instead of binding
+    reuse_port(bool): bind with SO_REUSEPORT so several processes can share
+        the port
+    binary_port(int): Port of the binary protocol, 0 disables it
+    binary_sock(socket): already listening socket of the binary protocol
+    metrics_port(int): Port of the HTTP metrics endpoint, 0 disables it
+    ready(callable): called once every server accepts connections
 
     Returns:
     None
 
     """
 
-    # Get a reference to the event loop as we plan to use
-    # low-level APIs.
+    global SCANNER
+    if REREAD and SCAN_EXECUTOR != 'none':
+        SCANNER = Scanner(FILEPATH)
+
     loop = asyncio.get_running_loop()
+    servers = [await start_server(
+        ServerProtocol, ip_address, port, sock, reuse_port)]
+
+    if binary_port or binary_sock is not None:
+        servers.append(await start_server(
+            BinaryProtocol, ip_address, binary_port, binary_sock, reuse_port))
 
-    server = await loop.create_server(
-        lambda: ServerProtocol(),
-        ip_address, port)
+    # the port of a worker is bound again by its successor while a reload
+    # hands over
+    if metrics_port:
+        servers.append(await serve_metrics(
+            ip_address, metrics_port, reuse_port=True))
 
-    addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+    # keep the index and filter in step with the data file
+    if WATCH_FILE and (BLOOM_FILTER or SORTED_INDEX or not REREAD):
+        watcher = DatasetWatcher(LINUXPATH, reload_data, key=_data_version)
+        watcher.start()
+
+    addrs = ', '.join(
+        str(sock.getsockname())
+        for server in servers for sock in server.sockets)
     logger.info('Serving on {}'.format(str(addrs)))
 
-    async with server:
-        await server.serve_forever()
+    stopping = asyncio.Event()
+    loop.add_signal_handler(signal.SIGQUIT, stopping.set)
+    loop.add_signal_handler(
+        signal.SIGHUP, loop.run_in_executor, None, reload_on_signal)
+
+    if ready is not None:
+        ready()
+
+    try:
+        await stopping.wait()
+        await drain(servers)
+    finally:
+        for server in servers:
+            server.close()
+
+        # workers leave with os._exit, which would orphan the scan processes
+        if SCANNER is not None:
+            SCANNER.close(wait=True)
+            SCANNER = None
+
+    # the loop keeps running once the served coroutine returns
+    loop.stop()
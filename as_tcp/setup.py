@@ -1,64 +1,390 @@
+import atexit
 import configparser
+import glob
 import logging
-from logging.handlers import RotatingFileHandler
-from collections import defaultdict
+from logging.handlers import (
+    QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler)
+import multiprocessing
 from pathlib import Path
+import os
 from os import path
+import queue
 import sys
+from timeit import default_timer as timer
 
 MAX_BYTE = 1024
 BASE_DIR = Path(__file__).resolve().parent
 INI_FILE = 'config.ini'
 
+config = configparser.ConfigParser()
+config.read(BASE_DIR / INI_FILE)
+
+LOG_LEVEL = config['DEFAULT'].get('LOG_LEVEL', 'INFO').upper()
+LOG_MAX_BYTES = config['DEFAULT'].getint('LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = config['DEFAULT'].getint('LOG_BACKUP_COUNT', 3)
+LOG_DEBUG_RATE = config['DEFAULT'].getint('LOG_DEBUG_RATE', 100)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most rate DEBUG records per second, records of higher
+    levels always pass
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.window = 0.0
+        self.count = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+
+        now = timer()
+        if now - self.window >= 1.0:
+            self.window = now
+            self.count = 0
+
+        self.count += 1
+        return self.count <= self.rate
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating log file that is reopened once another process rotated it, as
+    the supervisor a reload starts does while the previous one drains
+    """
+
+    def shouldRollover(self, record):
+        if self.stream is not None:
+            try:
+                current = os.stat(self.baseFilename)
+            except FileNotFoundError:
+                current = None
+            opened = os.fstat(self.stream.fileno())
+            if current is None or (current.st_dev, current.st_ino) != (
+                    opened.st_dev, opened.st_ino):
+                self.stream.close()
+                self.stream = None
+
+        return super().shouldRollover(record)
+
+
 # setup logger
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
 formatter = logging.Formatter('%(asctime)s | %(levelname)s | %(message)s')
 
-file_handler = RotatingFileHandler(
-    BASE_DIR / 'logs.log',
-    maxBytes=MAX_BYTE + MAX_BYTE
-)
+# processes spawned by the index builder and scan pools only append, the
+# process that spawned them rotates the file
+if multiprocessing.parent_process() is None:
+    file_handler = SharedRotatingFileHandler(
+        BASE_DIR / 'logs.log',
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT
+    )
+else:
+    file_handler = WatchedFileHandler(BASE_DIR / 'logs.log')
 file_handler.setFormatter(formatter)
 
 stdout_handler = logging.StreamHandler(sys.stdout)
 stdout_handler.setFormatter(formatter)
 
-logger.addHandler(file_handler)
-logger.addHandler(stdout_handler)
+# records are only queued on the calling thread, a listener thread formats
+# them and does the file I/O and rotation
+log_queue = queue.SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(RateLimitFilter(LOG_DEBUG_RATE))
+logger.addHandler(queue_handler)
 
-config = configparser.ConfigParser()
-config.read(BASE_DIR / INI_FILE)
+listener = QueueListener(
+    log_queue, file_handler, stdout_handler, respect_handler_level=True)
+listener.start()
+
+# queue workers forward their records on to the supervisor, which alone
+# writes them, None until the supervisor shares its handlers
+worker_queue = None
+worker_listener = None
+
+
+def hold_handlers():
+    """
+    waits for the listener to finish the record it is writing before a
+    fork, the child would find the stream locked otherwise
+
+    Returns:
+    None
+
+    """
+
+    for handler in (file_handler, stdout_handler):
+        handler.acquire()
+
+
+def release_handlers():
+    """
+    lets the listener of the parent write again once it forked
+
+    Returns:
+    None
+
+    """
+
+    for handler in (file_handler, stdout_handler):
+        handler.release()
+
+
+def restart_listener():
+    """
+    starts a listener thread in a forked process, threads do not survive
+    the fork
+
+    Returns:
+    None
+
+    """
+
+    # the queue may have been forked in the middle of a get of the parent
+    # listener, leaving a lock that misses wakeups, records still in it are
+    # the parent's to write
+    queue_handler.queue = listener.queue = queue.SimpleQueue()
+    listener._thread = None
+    listener.start()
+
+
+def share_handlers():
+    """
+    starts writing the records of worker processes forked from now on,
+    which forward them instead of opening the log file themselves
+
+    Returns:
+    None
+
+    """
+
+    global worker_queue, worker_listener
+    if worker_listener is not None:
+        return
+
+    worker_queue = multiprocessing.get_context('fork').Queue()
+    worker_listener = QueueListener(
+        worker_queue, *listener.handlers, respect_handler_level=True)
+    worker_listener.start()
+
+
+def forward_records():
+    """
+    sends the records of a forked worker to the supervisor that shared its
+    handlers, once those of the worker are written
+
+    Returns:
+    None
+
+    """
+
+    global worker_listener
+    if worker_queue is None:
+        return
+
+    # the listener thread of the supervisor did not survive the fork
+    worker_listener = None
+    stop_listener()
+    queue_handler.queue = worker_queue
+
+
+def stop_listener():
+    """
+    writes out the queued records and stops the listener threads, a worker
+    waits for its forwarded records to be sent
+
+    Returns:
+    None
+
+    """
+
+    global worker_listener
+    if listener._thread is not None:
+        listener.stop()
+
+    if worker_listener is not None:
+        worker_listener.stop()
+        worker_listener = None
+    elif queue_handler.queue is worker_queue:
+        worker_queue.close()
+        worker_queue.join_thread()
+
+
+def remove_handler(handler):
+    """
+    stops writing log records to a handler
+
+    Parameters:
+    handler(Handler): handler to be removed
+
+    Returns:
+    None
+
+    """
+
+    listener.handlers = tuple(
+        current for current in listener.handlers if current is not handler)
+
+
+os.register_at_fork(before=hold_handlers, after_in_parent=release_handlers,
+                    after_in_child=restart_listener)
+atexit.register(stop_listener)
 
 LINUXPATH = config['DEFAULT'].get('LINUXPATH')
 REREAD = config['DEFAULT'].getboolean('REREAD_ON_QUERY')
+DEBUG_RESPONSE = config['DEFAULT'].getboolean('DEBUG_RESPONSE', False)
+REMAP_INTERVAL = config['DEFAULT'].getfloat('REMAP_INTERVAL', 0.1)
+WATCH_FILE = config['DEFAULT'].getboolean('WATCH_FILE', True)
+WATCH_INTERVAL = config['DEFAULT'].getfloat('WATCH_INTERVAL', 1.0)
+SCAN_EXECUTOR = config['DEFAULT'].get('SCAN_EXECUTOR', 'process')
+SCAN_WORKERS = config['DEFAULT'].getint('SCAN_WORKERS', 0)
+SCAN_SEGMENT_BYTES = config['DEFAULT'].getint(
+    'SCAN_SEGMENT_BYTES', 64 * 1024 * 1024)
+SCAN_BATCH_WINDOW = config['DEFAULT'].getfloat('SCAN_BATCH_WINDOW', 0.001)
+SCAN_BATCH_SIZE = config['DEFAULT'].getint('SCAN_BATCH_SIZE', 256)
+CACHE_SIZE = config['DEFAULT'].getint('CACHE_SIZE', 65536)
+PERSIST_INDEX = config['DEFAULT'].getboolean('PERSIST_INDEX', True)
+INDEX_PATH = config['DEFAULT'].get('INDEX_PATH', '') or None
+BLOOM_FILTER = config['DEFAULT'].getboolean('BLOOM_FILTER', False)
+BLOOM_PATH = config['DEFAULT'].get('BLOOM_PATH', '') or None
+BLOOM_ERROR_RATE = config['DEFAULT'].getfloat('BLOOM_ERROR_RATE', 0.01)
+BLOOM_MAX_BYTES = config['DEFAULT'].getint('BLOOM_MAX_BYTES', 64 * 1024 * 1024)
+SORTED_INDEX = config['DEFAULT'].getboolean('SORTED_INDEX', False)
+SORTED_INDEX_PATH = config['DEFAULT'].get('SORTED_INDEX_PATH', '') or None
+PREFIX_LIMIT = config['DEFAULT'].getint('PREFIX_LIMIT', 100)
+PREFIX_MAX_LIMIT = config['DEFAULT'].getint('PREFIX_MAX_LIMIT', 10000)
+INDEX_WORKERS = config['DEFAULT'].getint('INDEX_WORKERS', 0)
+INDEX_CHUNK_BYTES = config['DEFAULT'].getint(
+    'INDEX_CHUNK_BYTES', 64 * 1024 * 1024)
+INDEX_MAX_SEGMENTS = config['DEFAULT'].getint('INDEX_MAX_SEGMENTS', 16)
 IP_ADRESS = config['DEFAULT'].get('IP_ADDRESS')
 PORT = config['DEFAULT'].getint('PORT')
+BINARY_PORT = config['DEFAULT'].getint('BINARY_PORT', 0)
+MAX_QUERIES = config['DEFAULT'].getint('MAX_QUERIES', 65536)
+METRICS_PORT = config['DEFAULT'].getint('METRICS_PORT', 0)
+MAX_CONNECTIONS = config['DEFAULT'].getint('MAX_CONNECTIONS', 10000)
+MAX_PENDING = config['DEFAULT'].getint('MAX_PENDING', 1024)
+WRITE_HIGH_WATER = config['DEFAULT'].getint('WRITE_HIGH_WATER', 256 * 1024)
+WRITE_LOW_WATER = config['DEFAULT'].getint('WRITE_LOW_WATER', 64 * 1024)
+IDLE_TIMEOUT = config['DEFAULT'].getfloat('IDLE_TIMEOUT', 300.0)
+READ_TIMEOUT = config['DEFAULT'].getfloat('READ_TIMEOUT', 30.0)
+EVENT_LOOP = config['DEFAULT'].get('EVENT_LOOP', 'auto').lower()
+LISTEN_BACKLOG = config['DEFAULT'].getint('LISTEN_BACKLOG', 4096)
+TCP_NODELAY = config['DEFAULT'].getboolean('TCP_NODELAY', True)
+SO_RCVBUF = config['DEFAULT'].getint('SO_RCVBUF', 0)
+SO_SNDBUF = config['DEFAULT'].getint('SO_SNDBUF', 0)
+TCP_KEEPALIVE = config['DEFAULT'].getboolean('TCP_KEEPALIVE', True)
+KEEPALIVE_IDLE = config['DEFAULT'].getint('KEEPALIVE_IDLE', 60)
+KEEPALIVE_INTERVAL = config['DEFAULT'].getint('KEEPALIVE_INTERVAL', 10)
+KEEPALIVE_COUNT = config['DEFAULT'].getint('KEEPALIVE_COUNT', 6)
+WORKERS = config['DEFAULT'].getint('WORKERS', 1)
+REUSE_PORT = config['DEFAULT'].getboolean('REUSE_PORT', True)
+RESTART_DELAY = config['DEFAULT'].getfloat('RESTART_DELAY', 1.0)
+DRAIN_TIMEOUT = config['DEFAULT'].getfloat('DRAIN_TIMEOUT', 30.0)
+READY_TIMEOUT = config['DEFAULT'].getfloat('READY_TIMEOUT', 60.0)
 
 TEST_STRING = config['TEST'].get('TEST_STRING').encode()
 
-# check if linux path configuration is absolute or relative
-if path.exists(LINUXPATH):
-    FILEPATH = LINUXPATH
-elif path.exists(BASE_DIR / LINUXPATH):
-    FILEPATH = BASE_DIR / LINUXPATH
-else:
-    raise FileNotFoundError('{!r} does not exist \
-        please edit "LINUXPATH" in {!r}'.format(
-            LINUXPATH,
-            BASE_DIR / INI_FILE))
+# files the server writes beside data files, never data themselves
+ARTIFACT_SUFFIXES = ('.idx', '.bloom', '.sidx', '.lock', '.tmp', '.part')
+
+
+def is_data_file(name):
+    return (path.isfile(name) and not path.basename(name).startswith('.')
+            and not str(name).endswith(ARTIFACT_SUFFIXES))
+
+
+def data_paths(spec):
+    """
+    resolves the data files of a LINUXPATH setting: a file, a directory or a
+    glob pattern, or several of them separated by commas
+
+    Parameters:
+    spec(string): LINUXPATH setting, relative paths are looked up in the
+        working directory first and beside this module then
+
+    Returns:
+    list: paths of the data files in order, directories and patterns being
+    sorted by name
+
+    """
+
+    paths = []
+    seen = set()
+    for pattern in filter(None, (part.strip() for part in spec.split(','))):
+        # check if linux path configuration is absolute or relative
+        for candidate in (pattern, BASE_DIR / pattern):
+            if path.isfile(candidate):
+                found = [candidate]
+                break
+
+            if path.isdir(candidate):
+                found = [path.join(candidate, name)
+                         for name in sorted(os.listdir(candidate))]
+            else:
+                found = sorted(glob.glob(str(candidate)))
+
+            found = list(filter(is_data_file, found))
+            if found:
+                break
+        else:
+            raise FileNotFoundError('{!r} does not exist \
+                please edit "LINUXPATH" in {!r}'.format(
+                    pattern,
+                    BASE_DIR / INI_FILE))
+
+        # a file matched by several patterns is served once
+        for name in found:
+            real = path.realpath(name)
+            if real not in seen:
+                seen.add(real)
+                paths.append(name)
+
+    if not paths:
+        raise FileNotFoundError(
+            'please edit "LINUXPATH" in {!r}'.format(BASE_DIR / INI_FILE))
+
+    return paths
+
+
+DATA_PATHS = data_paths(LINUXPATH)
+
+# the first data file, the only one of single file datasets
+FILEPATH = DATA_PATHS[0]
+
+if len(DATA_PATHS) > 1 and (REREAD or BLOOM_FILTER or SORTED_INDEX
+                            or INDEX_PATH):
+    raise ValueError(
+        'REREAD_ON_QUERY, BLOOM_FILTER, SORTED_INDEX and INDEX_PATH need a '
+        'single data file, LINUXPATH matches {}'.format(len(DATA_PATHS)))
 
-HASHMAP = defaultdict(lambda: -1)
 NEW_LINE = '\r\n'
+LINE_END = b'\n'
 ENCODING = 'utf-8'
 ERROR_START = 'ERROR'
 ERROR_MSG = 'INTERNAL SERVER ERROR'
 DEBUG_START = NEW_LINE + 'DEBUG:' + NEW_LINE
 
+# starts every command, doubled it escapes lines starting with it
+COMMAND_START = b'!'
+
 NOT_FOUND_MESSAGE = 'STRING NOT FOUND'
 FOUND_MESSAGE = 'STRING EXISTS'
+OK_MESSAGE = 'OK'
+BUSY_MESSAGE = 'SERVER BUSY'
+
+# responses sent as they are when the debug block is off
+NOT_FOUND_RESPONSE = (NOT_FOUND_MESSAGE + NEW_LINE).encode(ENCODING)
+FOUND_RESPONSE = (FOUND_MESSAGE + NEW_LINE).encode(ENCODING)
+OK_RESPONSE = (OK_MESSAGE + NEW_LINE).encode(ENCODING)
+BUSY_RESPONSE = (BUSY_MESSAGE + NEW_LINE).encode(ENCODING)
 
 OVERFLOW_MESSAGE = 'maximum payload size is'
 
-logger.debug('FILEPATH: {!r}'.format(FILEPATH))
+logger.debug('DATA_PATHS: {!r}'.format(DATA_PATHS))
 logger.debug('REREAD_ON_QUERY: {!r}'.format(REREAD))
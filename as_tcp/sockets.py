@@ -0,0 +1,95 @@
+import socket
+
+# Project Modules
+from .setup import (
+    KEEPALIVE_COUNT,
+    KEEPALIVE_IDLE,
+    KEEPALIVE_INTERVAL,
+    LISTEN_BACKLOG,
+    SO_RCVBUF,
+    SO_SNDBUF,
+    TCP_KEEPALIVE,
+    TCP_NODELAY,
+    logger
+)
+
+# keepalive options by setting, missing on some platforms
+KEEPALIVE_OPTIONS = [
+    (getattr(socket, name), value)
+    for name, value in (
+        ('TCP_KEEPIDLE', KEEPALIVE_IDLE),
+        ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+        ('TCP_KEEPCNT', KEEPALIVE_COUNT))
+    if value and hasattr(socket, name)
+]
+
+
+def listen_socket(ip_address, port, reuse_port=False):
+    """
+    creates a listening socket with the configured backlog and buffer sizes,
+    which the connections it accepts inherit
+
+    Parameters:
+    ip_address(string): IP Address to bind the socket to
+    port(int): Port to bind the socket to
+    reuse_port(bool): bind with SO_REUSEPORT
+
+    Returns:
+    socket: bound and listening socket
+
+    """
+
+    family, kind, proto, _, address = socket.getaddrinfo(
+        ip_address, port, type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE)[0]
+
+    sock = socket.socket(family, kind, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        # set before listening so the window scale is negotiated for them
+        if SO_RCVBUF:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SO_RCVBUF)
+        if SO_SNDBUF:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SO_SNDBUF)
+
+        sock.bind(address)
+        sock.listen(LISTEN_BACKLOG)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
+
+
+def tune_connection(transport):
+    """
+    applies TCP_NODELAY and keepalive settings to an accepted connection
+
+    Parameters:
+    transport(Transport): transport of the connection
+
+    Returns:
+    None
+
+    """
+
+    sock = transport.get_extra_info('socket')
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+
+    try:
+        sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, int(TCP_NODELAY))
+
+        if TCP_KEEPALIVE:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in KEEPALIVE_OPTIONS:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+    # the peer may be gone already
+    except OSError as err:
+        logger.debug('could not tune connection: {}'.format(err))
@@ -1,14 +1,22 @@
+from contextlib import contextmanager
+import fcntl
+import importlib.util
 import mmap
+import os
+import struct
 import sys
+from timeit import default_timer as timer
 import traceback
 
 # Project Modules
 from .setup import (
     ENCODING,
+    EVENT_LOOP,
     FOUND_MESSAGE,
-    HASHMAP,
+    MAX_BYTE,
     NEW_LINE,
     NOT_FOUND_MESSAGE,
+    REMAP_INTERVAL,
     logger,
 )
 
@@ -33,30 +41,139 @@ def load_file(path):
         return mfile
 
 
-def hash_file(mfile):
+class MappedFile:
     """
-    converts each line of a byte string to hashmap keys
+    Read only mapping of a file shared by every query, remapped when the
+    file is replaced or changes size
+    """
+
+    def __init__(self, path, interval=REMAP_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.mfile = None
+        self.key = None
+        self.checked = 0.0
+
+    def get(self):
+        """
+        gets the mapping, checking the file at most once per interval
+
+        Returns:
+        bytes: Memory mapped bytes of file
+
+        """
+
+        now = timer()
+        if self.mfile is None or now - self.checked >= self.interval:
+            self.checked = now
+            self.refresh()
+
+        return self.mfile
+
+    def refresh(self):
+        """
+        remaps the file if its inode, size or modification time changed
+
+        Returns:
+        bool: 'True' if the file was remapped and 'False' otherwise
+
+        """
+
+        stat = os.stat(self.path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key == self.key:
+            return False
+
+        old = self.mfile
+        self.mfile = load_file(self.path) if stat.st_size else b''
+        self.key = key
+        logger.debug('{} remapped'.format(self.path))
+
+        close_map(old)
+        return True
+
+    def close(self):
+        close_map(self.mfile)
+        self.mfile = self.key = None
+
+
+def file_key(path):
+    """
+    identifies the current version of a file
+
+    Parameters:
+    path(path): path to file
+
+    Returns:
+    tuple: device, inode, size and modification time, None if missing
+
+    """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    holds an exclusive lock beside a file, so only one process at a time
+    builds it
+
+    Parameters:
+    path(path): path to file being built
+
+    Returns:
+    None
+
+    """
+
+    with open('{}.lock'.format(path), 'wb') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def close_map(mfile):
+    """
+    closes a mapping, leaving it to the garbage collector while buffers
+    exported from it are still in use
 
     Parameters:
-    mfile(bytes): bytes to be hash mapped
+    mfile(bytes): mapping to be closed
 
     Returns:
     None
 
     """
 
-    logger.debug('started hashing file')
+    if not isinstance(mfile, mmap.mmap):
+        return
 
-    while True:
-        line = mfile.readline()
-        if is_empty(line):
-            break
-        line = line.strip()
-        if is_empty(line):
-            continue
-        HASHMAP[line] = 1
+    try:
+        mfile.close()
+    except BufferError:
+        pass
 
-    logger.debug('file hashed successfully')
+
+def open_descriptors():
+    """
+    lists the file descriptors open in this process past the standard
+    streams, such as the duplicates memory maps keep of their files
+
+    Returns:
+    list: file descriptors, empty where /proc is not available
+
+    """
+
+    try:
+        fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except FileNotFoundError:
+        return []
+
+    return [fd for fd in fds if fd > 2]
 
 
 def is_empty(word):
@@ -99,13 +216,154 @@ def debug_message(**kwargs):
 
     """
 
-    debug_str = ''
+    return ''.join(
+        '\t {}: {}{}'.format(key, value, NEW_LINE)
+        for key, value in kwargs.items())
+
+
+# binary protocol framing, big endian query count and query length
+COUNT = struct.Struct('!I')
+LENGTH = struct.Struct('!H')
 
-    for key, value in kwargs.items():
-        debug_str += '\t {}: {}{}'.format(key, value, NEW_LINE)
 
-    logger.debug(debug_str)
-    return debug_str
+def pack_queries(queries):
+    """
+    frames queries as a binary protocol request
+
+    Parameters:
+    queries(list): queries as bytes
+
+    Returns:
+    bytes: request to be sent to the server
+
+    """
+
+    parts = [COUNT.pack(len(queries))]
+    for query in queries:
+        parts.append(LENGTH.pack(len(query)))
+        parts.append(query)
+    return b''.join(parts)
+
+
+class RequestParser:
+    """
+    Parses binary protocol requests arriving over several reads, keeping
+    what it parsed of an incomplete request so the next read resumes there
+    """
+
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self.reset()
+
+    def reset(self):
+        # query count and queries of the current request, and the number of
+        # its bytes they were parsed from
+        self.count = None
+        self.queries = []
+        self.parsed = 0
+
+    def parse(self, buffer, position):
+        """
+        parses the request starting at position, the same request as the
+        previous call while that one was not complete
+
+        Parameters:
+        buffer(bytes): received bytes
+        position(int): offset of the request in buffer
+
+        Returns:
+        tuple: list of stripped queries and the offset after the request, None
+        if the request is not complete yet
+
+        """
+
+        size = len(buffer)
+        cursor = position + self.parsed
+
+        if self.count is None:
+            if size - cursor < COUNT.size:
+                return None
+            count, = COUNT.unpack_from(buffer, cursor)
+            if count > self.max_queries:
+                raise ValueError(
+                    'at most {} queries per request'.format(self.max_queries))
+            self.count = count
+            cursor += COUNT.size
+
+        queries = self.queries
+        while len(queries) < self.count:
+            if size - cursor < LENGTH.size:
+                break
+            length, = LENGTH.unpack_from(buffer, cursor)
+            if length > MAX_BYTE:
+                raise ValueError('maximum payload size is {}'.format(MAX_BYTE))
+
+            if size - cursor - LENGTH.size < length:
+                break
+            cursor += LENGTH.size
+            queries.append(bytes(buffer[cursor:cursor + length]).strip())
+            cursor += length
+        else:
+            self.reset()
+            return queries, cursor
+
+        self.parsed = cursor - position
+        return None
+
+
+def unpack_queries(buffer, position, max_queries):
+    """
+    parses a binary protocol request
+
+    Parameters:
+    buffer(bytes): received bytes
+    position(int): offset of the request in buffer
+    max_queries(int): largest number of queries accepted in a request
+
+    Returns:
+    tuple: list of stripped queries and the offset after the request, None
+    if the request is not complete yet
+
+    """
+
+    return RequestParser(max_queries).parse(buffer, position)
+
+
+def pack_results(results):
+    """
+    packs lookup results as a binary protocol response
+
+    Parameters:
+    results(list): 'True' for every query found
+
+    Returns:
+    bytes: response to be sent to the client
+
+    """
+
+    bitmap = bytearray((len(results) + 7) // 8)
+    for position, found in enumerate(results):
+        if found:
+            bitmap[position >> 3] |= 1 << (position & 7)
+    return COUNT.pack(len(results)) + bitmap
+
+
+def unpack_results(response):
+    """
+    parses a binary protocol response
+
+    Parameters:
+    response(bytes): complete response
+
+    Returns:
+    list: 'True' for every query found
+
+    """
+
+    count, = COUNT.unpack_from(response)
+    bitmap = response[COUNT.size:]
+    return [bool(bitmap[position >> 3] & 1 << (position & 7))
+            for position in range(count)]
 
 
 def default_exception():
@@ -133,3 +391,29 @@ def default_exception():
     logger.error('Exception type : {}'.format(ex_type.__name__))
     logger.error('Exception message : {}'.format(ex_value))
     logger.error('Stack trace : {}'.format(stack_trace))
+
+
+def use_uvloop(event_loop=EVENT_LOOP):
+    """
+    resolves whether the event loop of the server is uvloop
+
+    Parameters:
+    event_loop(string): uvloop, asyncio, or auto for uvloop when installed
+
+    Returns:
+    bool: 'True' to run on uvloop
+
+    """
+
+    if event_loop not in ('auto', 'uvloop', 'asyncio'):
+        raise ValueError('unknown EVENT_LOOP {!r}'.format(event_loop))
+
+    if event_loop == 'asyncio':
+        return False
+
+    if importlib.util.find_spec('uvloop') is None:
+        if event_loop == 'uvloop':
+            logger.warning('uvloop is not installed, using asyncio')
+        return False
+
+    return True
@@ -0,0 +1,168 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import time
+
+# Project Modules
+from .setup import (
+    data_paths,
+    logger,
+    WATCH_INTERVAL
+)
+from .util import default_exception, file_key
+
+# inotify events that can change the contents of a watched directory entry
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO
+             | IN_CREATE | IN_DELETE)
+
+
+def inotify_watch(directories):
+    """
+    watches directories with inotify
+
+    Parameters:
+    directories(list): paths to directories
+
+    Returns:
+    int: inotify file descriptor, None where inotify is not available
+
+    """
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (AttributeError, OSError):
+        return None
+
+    if fd < 0:
+        return None
+
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_EVENTS) < 0:
+            os.close(fd)
+            return None
+
+    return fd
+
+
+def dataset_version(pattern):
+    """
+    identifies the current version of every data file of a dataset
+
+    Parameters:
+    pattern(string): LINUXPATH setting
+
+    Returns:
+    tuple: path and version of every data file, None if there is none
+
+    """
+
+    try:
+        return tuple((str(path), file_key(path))
+                     for path in data_paths(pattern))
+    except FileNotFoundError:
+        return None
+
+
+class FileWatcher(threading.Thread):
+    """
+    Background thread calling back whenever a file changes, using inotify
+    where available and stat polling otherwise
+    """
+
+    def __init__(self, path, on_change, interval=WATCH_INTERVAL, key=None):
+        super().__init__(name='watcher', daemon=True)
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.fd = None
+
+        # version the current data was loaded from, a change since then is
+        # noticed on the first check. Read when the thread starts if None
+        self.key = key
+
+    def directories(self):
+        # watch the directory so replacing the file by rename is noticed
+        return [os.path.dirname(os.path.abspath(self.path))]
+
+    def version(self):
+        return file_key(self.path)
+
+    def run(self):
+        self.fd = inotify_watch(self.directories())
+        logger.info('watching {} with {}'.format(
+            self.path, 'stat polling' if self.fd is None else 'inotify'))
+
+        key = self.version() if self.key is None else self.key
+        waiting = self.key is None
+        while not self.stopped.is_set():
+            # data loaded from an earlier version is checked at once
+            if waiting:
+                self.wait()
+            waiting = True
+
+            current = self.version()
+            if current is None or current == key:
+                continue
+
+            key = current
+            logger.info('{} changed'.format(self.path))
+            try:
+                self.on_change()
+            except Exception:
+                default_exception()
+
+        if self.fd is not None:
+            os.close(self.fd)
+
+    def wait(self):
+        """
+        blocks until the directory reports an event or the interval ends
+
+        Returns:
+        None
+
+        """
+
+        if self.fd is None:
+            self.stopped.wait(self.interval)
+            return
+
+        readable, _, _ = select.select([self.fd], [], [], self.interval)
+        if readable:
+            # let a burst of writes settle before rebuilding
+            time.sleep(min(self.interval, 0.2))
+            self.drain()
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def stop(self):
+        self.stopped.set()
+
+
+class DatasetWatcher(FileWatcher):
+    """
+    Watches every data file of a LINUXPATH setting, noticing files that are
+    added or removed as well as changed ones
+    """
+
+    def directories(self):
+        return sorted({os.path.dirname(os.path.abspath(path))
+                       for path in data_paths(self.path)})
+
+    def version(self):
+        return dataset_version(self.path)
@@ -0,0 +1,374 @@
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from timeit import default_timer as timer
+
+# third party libraries
+from aiorun import run
+
+# Project Modules
+from .server import serve
+from .sockets import listen_socket
+from .setup import (
+    BINARY_PORT,
+    logger,
+    METRICS_PORT,
+    READY_TIMEOUT,
+    RESTART_DELAY,
+    REUSE_PORT,
+    forward_records,
+    share_handlers,
+    stop_listener
+)
+from .util import default_exception, use_uvloop
+
+# environment variable handing the listening sockets of a supervisor down to
+# the one a reload starts
+HANDOFF_ENV = 'AS_TCP_HANDOFF'
+
+# directory as_tcp is imported from, the working directory is / once daemonized
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker_count(workers):
+    """
+    resolves the configured number of worker processes
+
+    Parameters:
+    workers(int): configured worker count, 0 means one per cpu core
+
+    Returns:
+    int: number of workers to be started
+
+    """
+
+    if workers > 0:
+        return workers
+
+    return os.cpu_count() or 1
+
+
+def bound_socket(sock, ip_address, port, reuse_port):
+    """
+    keeps an inherited listening socket that is still bound to the
+    configured port, so connections waiting on it are not lost, or binds
+    a new one
+
+    Parameters:
+    sock(socket): inherited listening socket, None if there is none
+    ip_address(string): IP Address to bind a new socket to
+    port(int): configured port, 0 for no socket
+    reuse_port(bool): bind a new socket with SO_REUSEPORT
+
+    Returns:
+    socket: listening socket, None if port is 0
+
+    """
+
+    if sock is not None and port and sock.getsockname()[1] == port:
+        return sock
+
+    if sock is not None:
+        sock.close()
+
+    if not port:
+        return None
+    return listen_socket(ip_address, port, reuse_port)
+
+
+def socket_slots(ip_address, port, count, reuse_port, inherited=()):
+    """
+    gets the listening sockets of the workers: a pair of the line and binary
+    protocol sockets shared by every worker, or one pair per worker bound
+    with SO_REUSEPORT. Workers replacing one another take over the pair of
+    the one they replace
+
+    Parameters:
+    ip_address(string): IP Address to bind to
+    port(int): Port of the line protocol
+    count(int): number of pairs
+    reuse_port(bool): bind with SO_REUSEPORT
+    inherited(list): pairs handed down by the previous supervisor
+
+    Returns:
+    list: pairs of listening sockets, the binary one None when disabled
+
+    """
+
+    inherited = list(inherited)
+    slots = []
+    for number in range(count):
+        sock, binary_sock = (
+            inherited[number] if number < len(inherited) else (None, None))
+        slots.append((
+            bound_socket(sock, ip_address, port, reuse_port),
+            bound_socket(binary_sock, ip_address, BINARY_PORT, reuse_port)))
+
+    for pair in inherited[count:]:
+        for sock in pair:
+            if sock is not None:
+                sock.close()
+
+    return slots
+
+
+def inherited_sockets(environ=os.environ):
+    """
+    takes over the listening sockets handed down by the supervisor whose
+    reload started this process
+
+    Parameters:
+    environ(dict): environment of the process, the handoff is removed from
+        it so workers do not see it
+
+    Returns:
+    tuple: process id of the previous supervisor and its pairs of listening
+    sockets, None and an empty list when started afresh
+
+    """
+
+    handoff = environ.pop(HANDOFF_ENV, None)
+    if not handoff:
+        return None, []
+
+    handoff = json.loads(handoff)
+    slots = [
+        tuple(None if fd is None else socket.socket(fileno=fd) for fd in pair)
+        for pair in handoff['slots']]
+    return handoff['parent'], slots
+
+
+def start_successor(slots):
+    """
+    starts a supervisor reading the configuration and the data file anew,
+    which inherits the listening sockets so no connection is refused
+
+    Parameters:
+    slots(list): pairs of listening sockets
+
+    Returns:
+    int: process id of the new supervisor
+
+    """
+
+    env = dict(os.environ)
+    env[HANDOFF_ENV] = json.dumps({
+        'parent': os.getpid(),
+        'slots': [[None if sock is None else sock.fileno() for sock in pair]
+                  for pair in slots],
+    })
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [PACKAGE_ROOT, env.get('PYTHONPATH')]))
+
+    # the standard streams of a daemon are closed, give it /dev/null instead
+    fds = [sock.fileno()
+           for pair in slots for sock in pair if sock is not None]
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'as_tcp'] + sys.argv[1:], env=env, pass_fds=fds,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    return process.pid
+
+
+def wait_ready(fd, count, timeout):
+    """
+    waits for workers to report that they accept connections
+
+    Parameters:
+    fd(int): read end of the pipe workers report on
+    count(int): number of workers
+    timeout(float): seconds to wait at most
+
+    Returns:
+    bool: 'True' if every worker reported in time
+
+    """
+
+    deadline = timer() + timeout
+    while count > 0:
+        remaining = deadline - timer()
+        if remaining <= 0:
+            return False
+
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if readable:
+            count -= len(os.read(fd, count))
+
+    return True
+
+
+def start_worker(ip_address, port, sock, binary_sock=None, ready_fd=None,
+                 metrics_port=0):
+    """
+    forks a worker process running its own event loop
+
+    Parameters:
+    ip_address(string): IP Address to serve the server
+    port(int): Port where server will be served
+    sock(socket): inherited listening socket
+    binary_sock(socket): inherited listening socket of the binary protocol
+    ready_fd(int): pipe the worker reports on once it accepts connections
+    metrics_port(int): Port of the HTTP metrics endpoint, 0 disables it
+
+    Returns:
+    int: process id of the worker
+
+    """
+
+    pid = os.fork()
+    if pid:
+        return pid
+
+    # worker process: drop the supervisor signal handlers
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                   signal.SIGQUIT):
+        signal.signal(signum, signal.SIG_DFL)
+    forward_records()
+
+    def ready():
+        os.write(ready_fd, b'.')
+        os.close(ready_fd)
+
+    code = 0
+    try:
+        server = serve(
+            ip_address, port, sock=sock, binary_sock=binary_sock,
+            metrics_port=metrics_port,
+            ready=None if ready_fd is None else ready)
+        run(server, use_uvloop=use_uvloop())
+    except Exception:
+        default_exception()
+        code = 1
+    finally:
+        stop_listener()
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def supervise(ip_address, port, workers, inherited=(), parent=None):
+    """
+    runs the server in several worker processes and restarts the ones
+    that exit unexpectedly. SIGHUP starts a new supervisor with the
+    configuration and data file read anew, which drains this one once its
+    workers are ready. SIGQUIT drains the workers, SIGTERM stops them
+
+    Parameters:
+    ip_address(string): IP Address to serve the server
+    port(int): Port where server will be served
+    workers(int): number of worker processes
+    inherited(list): pairs of listening sockets of the previous supervisor
+    parent(int): process id of the previous supervisor, None on a fresh start
+
+    Returns:
+    None
+
+    """
+
+    reuse_port = REUSE_PORT and hasattr(socket, 'SO_REUSEPORT')
+    slots = socket_slots(
+        ip_address, port, workers if reuse_port else 1, reuse_port, inherited)
+
+    # number and start time of every worker by process id, a worker
+    # replacing another takes over its number
+    children = {}
+    successor = None
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGQUIT if signum == signal.SIGQUIT
+                    else signal.SIGTERM)
+
+    def reload(signum, frame):
+        nonlocal successor
+        if stopping or successor is not None:
+            logger.warning('Reload already under way, ignoring SIGHUP')
+            return
+
+        successor = start_successor(slots)
+        logger.info('Reloading in supervisor {}'.format(successor))
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGQUIT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    def start(number, ready_fd=None):
+        # each worker serves its own metrics, as scrapes of a shared port
+        # would reach any one of them
+        pid = start_worker(
+            ip_address, port, *slots[number % len(slots)], ready_fd,
+            metrics_port=METRICS_PORT and METRICS_PORT + number)
+        children[pid] = number, timer()
+
+    # only the supervisor writes the log file, workers send their records
+    share_handlers()
+
+    ready_fd = ready_out = None
+    if parent is not None:
+        ready_fd, ready_out = os.pipe()
+
+    for number in range(workers):
+        start(number, ready_out)
+
+    logger.info('Started {} workers {}'.format(workers, list(children)))
+
+    if parent is not None:
+        ready = wait_ready(ready_fd, workers, READY_TIMEOUT)
+        os.close(ready_fd)
+        os.close(ready_out)
+
+        if not ready:
+            logger.error('Workers not ready after {} s, supervisor {} keeps '
+                         'serving'.format(READY_TIMEOUT, parent))
+            stop(signal.SIGTERM, None)
+        elif not stopping:
+            # the previous workers stop accepting and finish their queries
+            try:
+                os.kill(parent, signal.SIGQUIT)
+            except ProcessLookupError:
+                pass
+            logger.info('Took over from supervisor {}'.format(parent))
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        if pid == successor:
+            successor = None
+            if not stopping:
+                logger.error('Reload failed, keeping the current workers')
+            continue
+
+        number, started = children.pop(pid, (None, None))
+        if number is None or stopping:
+            continue
+
+        if os.WIFSIGNALED(status):
+            reason = 'killed by signal {}'.format(os.WTERMSIG(status))
+        else:
+            reason = 'exited with code {}'.format(os.WEXITSTATUS(status))
+        logger.error('Worker {} {}, restarting'.format(pid, reason))
+
+        # avoid a busy loop if workers crash right after starting
+        if timer() - started < RESTART_DELAY:
+            time.sleep(RESTART_DELAY)
+
+        if not stopping:
+            start(number)
+
+    for pair in slots:
+        for sock in pair:
+            if sock is not None:
+                sock.close()
+
+    logger.info('All workers stopped')
@@ -0,0 +1,129 @@
+import argparse
+import os
+import random
+import string
+
+# characters lines are made of
+ALPHABET = (string.ascii_letters + string.digits).encode()
+
+# random characters lines are cut from
+POOL_BYTES = 1 << 20
+
+# lines written at once
+CHUNK_LINES = 65536
+
+# line length distributions by name
+DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+
+def parse_size(size):
+    """
+    parses a line count such as 10k, 1m or 10000
+
+    Parameters:
+    size(string): line count with an optional k or m suffix
+
+    Returns:
+    int: number of lines
+
+    """
+
+    size = size.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(size[-1:], 1)
+    if multiplier > 1:
+        size = size[:-1]
+
+    return int(float(size) * multiplier)
+
+
+def line_lengths(rand, distribution, mean, low, high):
+    """
+    yields line lengths of a distribution
+
+    Parameters:
+    rand(Random): random generator
+    distribution(string): fixed, uniform or lognormal
+    mean(int): average length
+    low(int): shortest length
+    high(int): longest length
+
+    Returns:
+    generator: line lengths
+
+    """
+
+    if distribution == 'fixed':
+        while True:
+            yield mean
+    elif distribution == 'uniform':
+        while True:
+            yield rand.randint(low, high)
+    elif distribution == 'lognormal':
+        # a long tail of lines well over the mean
+        while True:
+            length = int(rand.lognormvariate(0, 0.75) * mean)
+            yield min(high, max(low, length))
+    else:
+        raise ValueError('unknown distribution {!r}'.format(distribution))
+
+
+def generate(path, lines, distribution='uniform', mean=32, low=8, high=256,
+             seed=0):
+    """
+    writes a data file of distinct random lines
+
+    Parameters:
+    path(path): data file to be written
+    lines(int): number of lines
+    distribution(string): line length distribution
+    mean(int): average line length
+    low(int): shortest line length
+    high(int): longest line length
+    seed(int): seed of the random generator
+
+    Returns:
+    None
+
+    """
+
+    rand = random.Random(seed)
+    pool = bytes(rand.choice(ALPHABET) for _ in range(POOL_BYTES))
+    lengths = line_lengths(rand, distribution, mean, low, high)
+    randrange = rand.randrange
+
+    # written beside the final file so readers never see it half done
+    partial = '{}.part'.format(path)
+    with open(partial, 'wb') as f:
+        chunk = []
+        for number in range(lines):
+            # the line number keeps lines distinct
+            line = b'%x-' % number
+            length = max(0, next(lengths) - len(line))
+            start = randrange(POOL_BYTES - length)
+            chunk.append(line + pool[start:start + length] + b'\n')
+
+            if len(chunk) == CHUNK_LINES:
+                f.writelines(chunk)
+                chunk.clear()
+
+        f.writelines(chunk)
+
+    os.replace(partial, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Generates a data file of random lines')
+    parser.add_argument('path', help='data file to be written')
+    parser.add_argument('lines', help='number of lines, such as 10k or 1m')
+    parser.add_argument(
+        '--distribution', choices=DISTRIBUTIONS, default='uniform',
+        help='line length distribution')
+    parser.add_argument('--mean', type=int, default=32, help='average length')
+    parser.add_argument('--low', type=int, default=8, help='shortest line')
+    parser.add_argument('--high', type=int, default=256, help='longest line')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    generate(args.path, parse_size(args.lines), args.distribution,
+             args.mean, args.low, args.high, args.seed)
@@ -1,6 +1,9 @@
 import configparser
+import os
 from os import path
 import logging
+import re
+import signal
 import unittest
 import asyncio
 import tracemalloc
@@ -13,12 +16,21 @@ from as_tcp import (
     FOUND_MESSAGE,
     NOT_FOUND_MESSAGE,
     REREAD,
+    add_new_line,
+    BinaryProtocol,
+    pack_queries,
+    unpack_results,
     hash_file,
+    set_index,
     load_file,
     logger
 )
+from as_tcp import server, workers
 from as_tcp.client import ClientTestServerProtocol
+from as_tcp.metrics import METRICS
+from as_tcp.prefix import load_sorted, set_sorted
 from as_tcp.setup import BASE_DIR
+from as_tcp.workers import supervise
 
 INI_FILE = 'config.ini'
 
@@ -99,10 +111,37 @@ class TestServerProtocol(ClientTestServerProtocol):
     Just like direct parent but gets bytes from test configuration
     """
 
+    def connection_made(self, transport):
+        super().connection_made(transport)
+
+        # test cases read the debug block of responses
+        self.debug = True
+
     def get_bytes(self):
         return load_file(TEST_FILE_PATH)
 
 
+class TestDrainProtocol(server.ServerProtocol):
+    """
+    Server protocol that keeps connections open like the real one
+    """
+
+    def get_bytes(self):
+        return load_file(TEST_FILE_PATH)
+
+
+class TestBinaryProtocol(BinaryProtocol):
+    """
+    Binary protocol that closes the connection once it answered
+    """
+
+    def flush(self):
+        super().flush()
+
+        if not self.pending:
+            self.transport.close()
+
+
 class IntegrationTestCases(unittest.TestCase):
     """
     Tests every single non error server cases
@@ -135,12 +174,13 @@ class IntegrationTestCases(unittest.TestCase):
 
         return super().tearDown()
 
-    def run_connection(self, output_client):
+    def run_connection(self, output_client, server=TestServerProtocol):
         """
         start both the TCP client and server when called
 
         Parameters:
         output_client (TestClientProtocol): client class for testing
+        server (ServerProtocol): server class for testing
 
         Returns:
         None
@@ -148,12 +188,12 @@ class IntegrationTestCases(unittest.TestCase):
         """
 
         # Setting up server
-        coro = self.loop.create_server(TestServerProtocol, IP_ADRESS, PORT)
+        coro = self.loop.create_server(server, IP_ADRESS, PORT)
         self.loop.run_until_complete(coro)
 
         # Loading and hashing file
         if not REREAD:
-            hash_file(load_file(TEST_FILE_PATH))
+            set_index(hash_file(load_file(TEST_FILE_PATH)))
 
         # Setting up client
         client = serial_asyncio.create_serial_connection(
@@ -167,12 +207,13 @@ class IntegrationTestCases(unittest.TestCase):
         pending = asyncio.all_tasks(self.loop)
         self.loop.run_until_complete(asyncio.gather(*pending))
 
-    def get_output_client(self, input_data):
+    def get_output_client(self, input_data, line=True):
         """
         Called to get the client class for testing
 
         Parameters:
         input_data (bytes): bytes string to be sent to the server
+        line (bool): terminate input_data with a new line
 
         Returns:
         TestClientProtocol: clent class for testing
@@ -181,7 +222,7 @@ class IntegrationTestCases(unittest.TestCase):
 
         class OuputClient(TestClientProtocol):
             def send_data(self):
-                return input_data
+                return add_new_line(input_data) if line else input_data
 
         return OuputClient
 
@@ -227,6 +268,322 @@ class IntegrationTestCases(unittest.TestCase):
         self.assertIn('ab'*3, received.decode())
         self.assert_order()
 
+    """
+    test for success when several queries are pipelined in one write
+    """
+    def test_pipelined_queries_success(self):
+        self.run_connection(self.get_output_client(
+            add_new_line(found_str) + not_found_str))
+
+        """Test that every query gets its own response in order"""
+        response = received.decode()
+        self.assertEqual(response.count('SEARCH_QUERY'), 2)
+        self.assertLess(
+            response.index(FOUND_MESSAGE),
+            response.index(NOT_FOUND_MESSAGE))
+        self.assert_order()
+
+    """
+    test for success when the debug block is switched off by command
+    """
+    def test_debug_off_success(self):
+        self.run_connection(self.get_output_client(
+            add_new_line(b'!DEBUG OFF') + found_str))
+
+        """Test that only the pre-encoded responses are sent"""
+        self.assertEqual(received, b'OK\r\nSTRING EXISTS\r\n')
+        self.assert_order()
+
+    """
+    test for success of a binary protocol request
+    """
+    def test_binary_request_success(self):
+        request = pack_queries([found_str, not_found_str, found_str])
+        self.run_connection(
+            self.get_output_client(request, line=False), TestBinaryProtocol)
+
+        """Test that the bitmap marks the queries found"""
+        self.assertEqual(unpack_results(received), [True, False, True])
+        self.assert_order()
+
+    """
+    test for success when an unterminated query times out
+    """
+    def test_read_timeout_success(self):
+        read_timeout = server.READ_TIMEOUT
+        server.READ_TIMEOUT = 0.1
+        try:
+            self.run_connection(
+                self.get_output_client(found_str, line=False))
+        finally:
+            server.READ_TIMEOUT = read_timeout
+
+        """Test that the server closed the connection without answering"""
+        self.assertEqual(received, '')
+        self.assert_order()
+
+    def run_trickle(self, chunks, delay):
+        """
+        sends chunks to a server that keeps connections open, each after a
+        delay, until the server closes the connection
+
+        Parameters:
+        chunks (list): bytes to be sent in turn
+        delay (float): seconds to wait before every chunk
+
+        Returns:
+        tuple: bytes received and seconds from the first chunk to the close
+
+        """
+
+        async def trickle():
+            listener = await self.loop.create_server(
+                TestDrainProtocol, IP_ADRESS, PORT)
+            reader, writer = await asyncio.open_connection(IP_ADRESS, PORT)
+            started = None
+            for chunk in chunks:
+                await asyncio.sleep(delay)
+                if reader.at_eof():
+                    break
+                writer.write(chunk)
+                started = started or self.loop.time()
+            try:
+                data = await asyncio.wait_for(reader.read(), 5)
+            finally:
+                writer.close()
+                listener.close()
+            return data, self.loop.time() - started
+
+        timeouts = server.IDLE_TIMEOUT, server.READ_TIMEOUT
+        server.IDLE_TIMEOUT, server.READ_TIMEOUT = 30, 1
+        try:
+            return self.loop.run_until_complete(trickle())
+        finally:
+            server.IDLE_TIMEOUT, server.READ_TIMEOUT = timeouts
+
+    """
+    test for success when a query is left unterminated after being idle
+    """
+    def test_read_timeout_idle_success(self):
+        received, elapsed = self.run_trickle([found_str], 1.5)
+
+        """Test that the query timed out long before the idle timeout"""
+        self.assertEqual(received, b'')
+        self.assertLess(elapsed, 2)
+
+    """
+    test for success when a query trickles in a byte at a time
+    """
+    def test_read_timeout_trickle_success(self):
+        chunks = [found_str[i:i + 1] for i in range(len(found_str))]
+        received, elapsed = self.run_trickle(chunks, 0.4)
+
+        """Test that the bytes arriving did not extend the read timeout"""
+        self.assertEqual(received, b'')
+        self.assertLess(elapsed, 2)
+
+    """
+    test for success when a connection is over the maximum
+    """
+    def test_max_connections_success(self):
+        # another connection already takes the only slot
+        max_connections = server.MAX_CONNECTIONS
+        server.MAX_CONNECTIONS = 1
+        METRICS.open_connections += 1
+        try:
+            self.run_connection(self.get_output_client(found_str))
+        finally:
+            server.MAX_CONNECTIONS = max_connections
+            METRICS.open_connections -= 1
+
+        """Test that the connection is turned away"""
+        self.assertEqual(received, b'SERVER BUSY\r\n')
+        self.assert_order()
+
+    """
+    test for success of a multi-get
+    """
+    def test_mget_success(self):
+        self.run_connection(self.get_output_client(
+            add_new_line(b'!DEBUG OFF') + b'!MGET ' + found_str + b' '
+            + not_found_str + b' ' + found_str))
+
+        """Test that every query is answered in order"""
+        self.assertEqual(received, b'OK\r\n'
+                                   b'STRING EXISTS\r\n'
+                                   b'STRING NOT FOUND\r\n'
+                                   b'STRING EXISTS\r\n')
+        self.assert_order()
+
+    """
+    test for success of a multi-get with the debug block on
+    """
+    def test_mget_debug_success(self):
+        self.run_connection(self.get_output_client(
+            b'!MGET ' + found_str + b' ' + not_found_str))
+
+        """Test that the answers are followed by one debug block"""
+        response = received.decode()
+        self.assertTrue(response.startswith(
+            FOUND_MESSAGE + '\r\n' + NOT_FOUND_MESSAGE + '\r\nDEBUG:'))
+        self.assertEqual(response.count('SEARCH_QUERY'), 1)
+        self.assert_order()
+
+    """
+    test for success when a query is named like a command
+    """
+    def test_command_word_query_success(self):
+        self.run_connection(self.get_output_client(
+            add_new_line(b'METRICS') + add_new_line(b'!!MGET x')
+            + b'!UNKNOWN'))
+
+        """Test that both are looked up and the unknown command fails"""
+        response = received.decode()
+        self.assertEqual(response.count(NOT_FOUND_MESSAGE), 2)
+        self.assertIn('SEARCH_QUERY: !MGET x\r\n', response)
+        self.assertIn("ERROR: unknown command 'UNKNOWN'", response)
+        self.assert_order()
+
+    """
+    test for success of prefix queries
+    """
+    def test_prefix_success(self):
+        set_sorted(load_sorted(TEST_FILE_PATH))
+        try:
+            self.run_connection(self.get_output_client(
+                add_new_line(b'!COUNT ' + found_str)
+                + add_new_line(b'!PREFIX ' + found_str + b' 0')
+                + b'!PREFIX ' + found_str))
+        finally:
+            set_sorted(None)
+
+        """Test that the query itself is the first matching line"""
+        lines = received.split(b'\r\n')
+        self.assertEqual(lines[0], b'COUNT 1')
+        self.assertEqual(lines[-3:], [found_str, b'END', b''])
+
+        """Test that an empty page is refused"""
+        self.assertIn(b'limit is between 1 and', lines[1])
+        self.assert_order()
+
+    """
+    test for success when the server drains an open connection
+    """
+    def test_drain_success(self):
+        if not REREAD:
+            set_index(hash_file(load_file(TEST_FILE_PATH)))
+
+        async def drain_connection():
+            tcp_server = await self.loop.create_server(
+                TestDrainProtocol, IP_ADRESS, PORT)
+            reader, writer = await asyncio.open_connection(IP_ADRESS, PORT)
+            writer.write(add_new_line(found_str))
+            answer = await reader.readline()
+
+            draining = asyncio.ensure_future(server.drain([tcp_server]))
+            rest = await reader.read()
+            writer.close()
+            await draining
+            return answer, rest
+
+        try:
+            answer, rest = self.loop.run_until_complete(drain_connection())
+        finally:
+            server.ServerProtocol.draining = False
+
+        """Test that the answer is followed by the end of the stream"""
+        self.assertIn(FOUND_MESSAGE, answer.decode())
+        self.assertEqual(rest, b'')
+        self.assertFalse(server.CONNECTIONS)
+
+    """
+    test for success of REREAD lookups served by several workers
+    """
+    def test_reread_workers_success(self):
+        port = PORT + 1
+        pid = os.fork()
+        if pid == 0:
+            # the supervisor and its workers scan with their own pools
+            try:
+                server.REREAD = True
+                supervise(IP_ADRESS, port, 2)
+            finally:
+                os._exit(0)
+
+        async def query(message):
+            for _ in range(50):
+                try:
+                    reader, writer = await asyncio.open_connection(
+                        IP_ADRESS, port)
+                    break
+                except ConnectionRefusedError:
+                    await asyncio.sleep(0.1)
+            writer.write(add_new_line(message))
+            answer = await asyncio.wait_for(reader.readline(), 10)
+            writer.close()
+            return answer
+
+        try:
+            self.loop.run_until_complete(query(found_str))
+            answers = self.loop.run_until_complete(asyncio.gather(*(
+                query(found_str if number % 2 else not_found_str)
+                for number in range(200))))
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+        """Test that every concurrent query got its own answer"""
+        self.assertEqual(answers.count(add_new_line(b'STRING EXISTS')), 100)
+        self.assertEqual(
+            answers.count(add_new_line(b'STRING NOT FOUND')), 100)
+
+    """
+    test for success of the metrics endpoints of several workers
+    """
+    def test_worker_metrics_success(self):
+        port, metrics_port = PORT + 2, PORT + 3
+        pid = os.fork()
+        if pid == 0:
+            try:
+                workers.METRICS_PORT = metrics_port
+                supervise(IP_ADRESS, port, 2)
+            finally:
+                os._exit(0)
+
+        async def scrape(port):
+            for _ in range(50):
+                try:
+                    reader, writer = await asyncio.open_connection(
+                        IP_ADRESS, port)
+                    break
+                except ConnectionRefusedError:
+                    await asyncio.sleep(0.1)
+            writer.write(b'GET /metrics HTTP/1.1\r\n\r\n')
+            response = await asyncio.wait_for(reader.read(), 10)
+            writer.close()
+            return set(re.findall(rb'pid="(\d+)"', response))
+
+        try:
+            pids = [self.loop.run_until_complete(scrape(metrics_port + n))
+                    for n in range(2)]
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+        """Test that each port is served by a worker of its own"""
+        self.assertEqual([len(worker) for worker in pids], [1, 1])
+        self.assertNotEqual(pids[0], pids[1])
+
+    """
+    test for success of the metrics command
+    """
+    def test_metrics_command_success(self):
+        self.run_connection(self.get_output_client(b'!METRICS'))
+
+        """Test that the prometheus text is terminated"""
+        self.assertTrue(received.endswith(b'# EOF\r\n'))
+        self.assert_order()
+
     """
     test for success when REREAD is False and query not in file
     """
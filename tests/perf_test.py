@@ -0,0 +1,287 @@
+import json
+import os
+from os import path
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+import unittest
+
+# test modules
+from dataset import generate, parse_size
+
+PACKAGE_PATH = str(pathlib.Path(__file__).absolute().parent.parent)
+TESTS_PATH = path.dirname(path.abspath(__file__))
+
+# comma separated line counts to benchmark, such as 10k,1m,10m
+SIZES = os.environ.get('AS_TCP_PERF', '')
+
+# line length distribution of the generated data files
+DISTRIBUTION = os.environ.get('AS_TCP_PERF_DIST', 'uniform')
+
+# directory the generated data files are kept in between runs
+DATA_DIR = os.environ.get(
+    'AS_TCP_PERF_DIR', path.join(tempfile.gettempdir(), 'as_tcp_perf'))
+
+# results of this machine that later runs are compared against
+BASELINE_PATH = os.environ.get(
+    'AS_TCP_PERF_BASELINE', path.join(TESTS_PATH, 'perf_baseline.json'))
+
+# results of the last run
+RESULTS_PATH = os.environ.get(
+    'AS_TCP_PERF_RESULTS', path.join(TESTS_PATH, 'perf_results.json'))
+
+# share a result may exceed its baseline by before the run fails
+TOLERANCE = float(os.environ.get('AS_TCP_PERF_TOLERANCE', '0.5'))
+
+# set to replace the baseline with the results of this run
+UPDATE = os.environ.get('AS_TCP_PERF_UPDATE', '') not in ('', '0')
+
+# differences too small to be told from noise, in the unit of each result
+SLACK = {
+    'build_seconds': 0.05,
+    'hash_file_seconds': 0.05,
+    'startup_seconds': 0.05,
+    'startup_rss_bytes': 16 << 20,
+    'hash_lookup_us': 5.0,
+    'hash_lookup_p99_us': 20.0,
+    'reread_lookup_ms': 1.0,
+    'reread_lookup_p99_ms': 2.0,
+}
+
+# marks the results among the logs a measure prints
+RESULT_MARK = 'RESULT '
+
+# lookups timed in each mode, REREAD scans the whole file on a miss
+HASH_LOOKUPS = 20000
+REREAD_LOOKUPS = 40
+
+
+def p99(latencies):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+
+
+def max_rss():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure_build(data_path):
+    """
+    times building the persisted index and hashing the file in memory,
+    run in a fresh process
+    """
+
+    from as_tcp.index import hash_file, index_file, index_path, map_data
+
+    for stale in (index_path(data_path), index_path(data_path) + '.lock'):
+        if path.exists(stale):
+            os.remove(stale)
+
+    start = timer()
+    index_file(data_path, persist=True)
+    build_seconds = timer() - start
+
+    start = timer()
+    hash_file(map_data(data_path)[0])
+    hash_file_seconds = timer() - start
+
+    return {
+        'build_seconds': build_seconds,
+        'hash_file_seconds': hash_file_seconds,
+    }
+
+
+def measure_startup(data_path):
+    """
+    times loading the persisted index and looking queries up in hash and
+    REREAD mode, run in a fresh process
+    """
+
+    from as_tcp.bench import make_queries, sample_lines
+    from as_tcp.index import index_file, map_data
+    from as_tcp.scan import find_line
+
+    start = timer()
+    index = index_file(data_path, persist=True)
+    startup_seconds = timer() - start
+    startup_rss_bytes = max_rss()
+
+    hits = sample_lines(data_path, 1000, seed=0)
+    queries = [query for query, _ in make_queries(hits, HASH_LOOKUPS, 0.5, 0)]
+
+    hash_latencies = []
+    for query in queries:
+        start = timer()
+        query in index
+        hash_latencies.append(timer() - start)
+
+    data = map_data(data_path)[0]
+    reread_latencies = []
+    for query in queries[:REREAD_LOOKUPS]:
+        start = timer()
+        find_line(data, query)
+        reread_latencies.append(timer() - start)
+
+    return {
+        'startup_seconds': startup_seconds,
+        'startup_rss_bytes': startup_rss_bytes,
+        'hash_lookup_us': sum(hash_latencies) / len(hash_latencies) * 1e6,
+        'hash_lookup_p99_us': p99(hash_latencies) * 1e6,
+        'reread_lookup_ms':
+            sum(reread_latencies) / len(reread_latencies) * 1e3,
+        'reread_lookup_p99_ms': p99(reread_latencies) * 1e3,
+    }
+
+
+def run_measure(stage, data_path):
+    """
+    runs a measure in a fresh interpreter so memory and caches of one do
+    not leak into another
+
+    Parameters:
+    stage(string): build or startup
+    data_path(path): data file
+
+    Returns:
+    dict: results of the measure
+
+    """
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [PACKAGE_PATH, env.get('PYTHONPATH')]))
+
+    output = subprocess.run(
+        [sys.executable, path.abspath(__file__), stage, str(data_path)],
+        env=env, check=True, stdout=subprocess.PIPE).stdout
+    for line in output.decode().splitlines():
+        if line.startswith(RESULT_MARK):
+            return json.loads(line[len(RESULT_MARK):])
+
+    raise RuntimeError('{} measure printed no result'.format(stage))
+
+
+def data_file(lines):
+    """
+    gets a generated data file, generating it on first use
+
+    Parameters:
+    lines(int): number of lines
+
+    Returns:
+    string: path of the data file
+
+    """
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    data_path = path.join(DATA_DIR, '{}-{}.txt'.format(lines, DISTRIBUTION))
+    if not path.exists(data_path):
+        generate(data_path, lines, DISTRIBUTION)
+    return data_path
+
+
+def load_json(json_path):
+    if not path.exists(json_path):
+        return {}
+    with open(json_path) as f:
+        return json.load(f)
+
+
+def write_json(json_path, results):
+    with open(json_path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def regressions(results, baseline):
+    """
+    lists results worse than their baseline by more than the tolerance
+
+    Parameters:
+    results(dict): results by name
+    baseline(dict): baseline results by name
+
+    Returns:
+    list: descriptions of the regressions
+
+    """
+
+    found = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+
+        limit = max(baseline[name] * (1 + TOLERANCE),
+                    baseline[name] + SLACK.get(name, 0))
+        if value > limit:
+            found.append('{} is {:.4g}, baseline {:.4g}'.format(
+                name, value, baseline[name]))
+    return found
+
+
+class DatasetTestCases(unittest.TestCase):
+    """
+    Test for the synthetic dataset generator
+    """
+
+    def test_generate_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = path.join(directory, 'data.txt')
+            generate(data_path, 1000, 'lognormal', mean=20, low=8, high=64)
+
+            with open(data_path, 'rb') as f:
+                lines = f.read().splitlines()
+
+        """test that lines are distinct and within the length bounds"""
+        self.assertEqual(len(set(lines)), 1000)
+        self.assertTrue(all(8 <= len(line) <= 64 for line in lines))
+
+        """test line counts with suffixes"""
+        self.assertEqual(parse_size('10k'), 10000)
+        self.assertEqual(parse_size('1.5M'), 1500000)
+
+
+@unittest.skipUnless(SIZES, 'set AS_TCP_PERF=10k,1m,10m to benchmark')
+class PerfTestCases(unittest.TestCase):
+    """
+    Scaling benchmarks compared against the baseline of this machine
+    """
+
+    def test_scaling(self):
+        baseline = load_json(BASELINE_PATH)
+        results = load_json(RESULTS_PATH)
+        failures = []
+
+        for size in SIZES.split(','):
+            lines = parse_size(size)
+            key = '{}-{}'.format(lines, DISTRIBUTION)
+            data_path = data_file(lines)
+
+            result = run_measure('build', data_path)
+            result.update(run_measure('startup', data_path))
+            results[key] = result
+            print('\n{}: {}'.format(key, json.dumps(result, indent=2)))
+
+            # the first run of a size on a machine becomes its baseline
+            if UPDATE or key not in baseline:
+                baseline[key] = result
+                continue
+
+            failures.extend('{}: {}'.format(key, failure)
+                            for failure in regressions(result, baseline[key]))
+
+        write_json(RESULTS_PATH, results)
+        write_json(BASELINE_PATH, baseline)
+
+        self.assertFalse(failures, '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] in ('build', 'startup'):
+        measure = measure_build if sys.argv[1] == 'build' else measure_startup
+        print(RESULT_MARK + json.dumps(measure(sys.argv[2])))
+    else:
+        unittest.main()
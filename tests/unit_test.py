@@ -1,14 +1,28 @@
+import asyncio
 import configparser
-import io
 import logging
+import importlib.util
+import json
 import mmap
+import os
 from os import path
+import signal
+import socket
+import tempfile
+import threading
+import time
+from timeit import default_timer as timer
 import unittest
 
 # Project Modules
 from as_tcp import (
     load_file,
-    HASHMAP,
+    MappedFile,
+    pack_queries,
+    pack_results,
+    RequestParser,
+    unpack_queries,
+    unpack_results,
     hash_file,
     is_empty,
     add_new_line,
@@ -17,7 +31,23 @@ from as_tcp import (
     FOUND_MESSAGE,
     logger
 )
-from as_tcp.setup import BASE_DIR
+from as_tcp.bench import make_queries, percentile, sample_lines
+from as_tcp.bloom import filter_size, load_bloom
+from as_tcp.cache import ResultCache
+from as_tcp.index import (
+    build_segment, hash_lines, index_file, load_index, load_shards, map_data)
+from as_tcp.metrics import Histogram, Metrics
+from as_tcp.prefix import build_sorted, load_sorted, open_sorted
+from as_tcp.scan import (
+    find_in, find_line, FIND_QUERIES, scan_lines, Scanner, SLICE_BYTES)
+from as_tcp.setup import (
+    BASE_DIR, data_paths, file_handler, forward_records, RateLimitFilter,
+    restart_listener, share_handlers, stop_listener)
+from as_tcp.sockets import listen_socket
+from as_tcp.util import file_key, use_uvloop
+from as_tcp.watcher import FileWatcher
+from as_tcp.workers import (
+    HANDOFF_ENV, inherited_sockets, socket_slots, worker_count)
 
 INI_FILE = 'config.ini'
 
@@ -47,7 +77,6 @@ class UnitTestCases(unittest.TestCase):
 
     def setUp(self):
         self.file_path = TEST_FILE_PATH
-        HASHMAP.clear()
 
         return super().setUp()
 
@@ -73,25 +102,20 @@ class UnitTestCases(unittest.TestCase):
     Test hashing function
     """
     def test_hash_file_success(self):
-        """confirm that HASHMAP id empty"""
-        self.assertEqual(len(HASHMAP), 0)
-
         """hash bytes"""
-        hash_file(io.BytesIO(b'algo\r\nsciences\r\n\r\n'))
+        index = hash_file(b'algo\r\nsciences\r\n\r\n')
 
         """test that empty lines are not hashed"""
-        self.assertEqual(len(HASHMAP), 2)
+        self.assertEqual(len(index), 2)
 
-        """test that hashmap is correct"""
-        self.assertEqual(HASHMAP[b'algo'], 1)
+        """test that index is correct"""
+        self.assertIn(b'algo', index)
 
         """test for illegal value"""
-        self.assertEqual(HASHMAP[b'illegal value'], -1)
-
-    def tearDown(self):
-        HASHMAP.clear()
+        self.assertNotIn(b'illegal value', index)
 
-        return super().tearDown()
+        """test that lookups do not grow the index"""
+        self.assertEqual(len(index), 2)
 
     """
     Test is empty function
@@ -123,6 +147,669 @@ class UnitTestCases(unittest.TestCase):
     def test_add_new_line(self):
         self.assertEqual(add_new_line(b'sciences'), b'sciences\r\n')
 
+    """
+    Test persistent index is built, reused and rebuilt when stale
+    """
+    def test_load_index_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            index_path = data_path + '.idx'
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\nsciences\r\n\r\n')
+
+            index = load_index(data_path)
+
+            """test that empty lines are not indexed"""
+            self.assertEqual(len(index), 2)
+            self.assertIn(b'algo', index)
+            self.assertNotIn(b'illegal value', index)
+
+            """test that an up to date index file is reused"""
+            mtime = os.stat(index_path).st_mtime_ns
+            self.assertEqual(len(load_index(data_path)), 2)
+            self.assertEqual(os.stat(index_path).st_mtime_ns, mtime)
+
+            """test that appending to the data file only indexes the tail"""
+            with open(data_path, 'ab') as f:
+                f.write(b'tcp\n')
+            index = load_index(data_path)
+            self.assertEqual(len(index.segments), 2)
+            self.assertIn(b'tcp', index)
+            self.assertIn(b'algo', index)
+
+            """test that rewriting the data file rebuilds the index"""
+            with open(data_path, 'wb') as f:
+                f.write(b'udp\n')
+            index = load_index(data_path)
+            self.assertEqual(len(index.segments), 1)
+            self.assertIn(b'udp', index)
+            self.assertNotIn(b'algo', index)
+
+    """
+    Test datasets of several files indexed as one shard each
+    """
+    def test_load_shards_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, content in (('a.txt', b'algo\n'),
+                                  ('b.txt', b'sciences\n'),
+                                  ('.hidden', b'secret\n')):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(content)
+            a_path = os.path.join(directory, 'a.txt')
+            b_path = os.path.join(directory, 'b.txt')
+
+            """test that directories, globs and lists resolve to data files"""
+            self.assertEqual(data_paths(directory), [a_path, b_path])
+            self.assertEqual(
+                data_paths(os.path.join(directory, 'b*')), [b_path])
+            self.assertEqual(
+                data_paths('{0},{0}'.format(b_path) + ',' + a_path),
+                [b_path, a_path])
+            with self.assertRaises(FileNotFoundError):
+                data_paths(os.path.join(directory, 'missing*'))
+
+            index = load_shards(data_paths(directory), workers=1)
+            self.assertEqual(len(index), 2)
+            self.assertIn(b'algo', index)
+            self.assertIn(b'sciences', index)
+            self.assertNotIn(b'secret', index)
+
+            """test that index files beside the data files are skipped"""
+            self.assertEqual(data_paths(directory), [a_path, b_path])
+
+            """test that only the shards of changed files are rebuilt"""
+            with open(b_path, 'wb') as f:
+                f.write(b'tcp\n')
+            with open(os.path.join(directory, 'c.txt'), 'wb') as f:
+                f.write(b'udp\n')
+            updated = load_shards(data_paths(directory), index, workers=1)
+            self.assertIs(updated.shards[a_path], index.shards[a_path])
+            self.assertIn(b'tcp', updated)
+            self.assertIn(b'udp', updated)
+            self.assertNotIn(b'sciences', updated)
+
+            """test that removed files are dropped"""
+            os.remove(a_path)
+            updated = load_shards(data_paths(directory), updated, workers=1)
+            self.assertNotIn(b'algo', updated)
+            self.assertEqual(len(updated), 2)
+
+            """test that shards hashed in memory are built in parallel"""
+            hashed = load_shards(
+                data_paths(directory), persist=False, workers=2)
+            self.assertIn(b'tcp', hashed)
+            self.assertIn(b'udp', hashed)
+            self.assertNotIn(b'algo', hashed)
+            self.assertEqual(len(hashed), 2)
+
+    """
+    Test prefix queries of the sorted index
+    """
+    def test_sorted_index_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'tcp\r\nalgo\n\nalgorithm\nudp\nalgo \nalgebra')
+
+            index = load_sorted(data_path)
+
+            """test that distinct lines are kept in byte order"""
+            self.assertEqual(len(index), 5)
+            self.assertEqual(index.prefix(b'', 10)[0],
+                             [b'algebra', b'algo', b'algorithm', b'tcp',
+                              b'udp'])
+            self.assertIn(b'algorithm', index)
+            self.assertNotIn(b'algorithms', index)
+
+            """test that prefixes are counted and paged"""
+            self.assertEqual(index.count(b'alg'), 3)
+            self.assertEqual(index.count(b'x'), 0)
+            self.assertEqual(index.prefix(b'algo', 1), ([b'algo'], 1))
+            self.assertEqual(
+                index.prefix(b'algo', 1, 1), ([b'algorithm'], None))
+
+            """test that chunks sorted in parallel are merged"""
+            build_sorted(data_path, data_path + '.sidx', chunk_bytes=8,
+                         workers=2)
+            merged = open_sorted(data_path, data_path + '.sidx')
+            self.assertEqual(merged.prefix(b'', 10), index.prefix(b'', 10))
+
+            """test that a stale sorted index is rebuilt"""
+            with open(data_path, 'ab') as f:
+                f.write(b'\nalgol\n')
+            self.assertEqual(load_sorted(data_path).count(b'algo'), 3)
+
+            """test that a data file truncated in place reads no lines"""
+            index = load_sorted(data_path)
+            with open(data_path, 'r+b') as f:
+                f.truncate(0)
+            self.assertEqual(index.count(b'algo'), 0)
+            self.assertNotIn(b'algo', index)
+
+    """
+    Test a line completed by an append is indexed as a whole
+    """
+    def test_load_index_partial_line_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\nscien')
+            self.assertIn(b'scien', load_index(data_path))
+
+            with open(data_path, 'ab') as f:
+                f.write(b'ces\r\n')
+            index = load_index(data_path)
+            self.assertIn(b'sciences', index)
+            self.assertNotIn(b'scien', index)
+
+    """
+    Test lookups of an index whose data file is truncated in place
+    """
+    def test_truncated_data_file_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b''.join(b'%d\n' % number for number in range(5000)))
+
+            for persist in (True, False):
+                index = index_file(data_path, persist=persist)
+                with open(data_path, 'r+b') as f:
+                    content = f.read()
+                    f.truncate(0)
+                self.assertNotIn(b'4999', index)
+
+                """test that lines still in the file are found again"""
+                with open(data_path, 'wb') as f:
+                    f.write(content[:10])
+                self.assertIn(b'1', index)
+                self.assertNotIn(b'4999', index)
+
+                with open(data_path, 'wb') as f:
+                    f.write(content)
+
+    """
+    Test parallel builder hashes exactly like the serial one
+    """
+    def test_build_segment_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b''.join(
+                    b'%d\r\n' % number for number in range(10000)))
+
+            data, _ = map_data(data_path)
+            segment = build_segment(
+                data_path, data, chunk_bytes=4096, workers=2)
+            self.assertEqual(segment, hash_lines(data))
+
+    """
+    Test bloom filter has no false negatives and follows its data file
+    """
+    def test_load_bloom_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            lines = [str(number).encode() for number in range(1000)]
+            with open(data_path, 'wb') as f:
+                f.write(b'\r\n'.join(lines))
+
+            bloom = load_bloom(data_path)
+
+            """test that every line may be in the file"""
+            for line in lines:
+                self.assertTrue(bloom.may_contain(line))
+
+            """test that most other lines are ruled out"""
+            misses = sum(not bloom.may_contain(b'x' + line) for line in lines)
+            self.assertGreater(misses, 900)
+
+            """test that a changed data file gets a new filter"""
+            with open(data_path, 'ab') as f:
+                f.write(b'\r\nalgo')
+            self.assertNotEqual(load_bloom(data_path).key, bloom.key)
+            self.assertTrue(load_bloom(data_path).may_contain(b'algo'))
+
+    """
+    Test bloom filter is capped at its memory budget
+    """
+    def test_filter_size_success(self):
+        bits, hashes = filter_size(10 ** 6, 0.01, 1024)
+        self.assertEqual(bits, 8192)
+        self.assertGreaterEqual(hashes, 1)
+
+    """
+    Test mapping is shared until the file changes
+    """
+    def test_mapped_file_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\n')
+
+            mapped_file = MappedFile(data_path, interval=0)
+            first = mapped_file.get()
+
+            """test that an unchanged file keeps its mapping"""
+            self.assertIs(mapped_file.get(), first)
+
+            """test that a grown file is remapped and old map closed"""
+            with open(data_path, 'ab') as f:
+                f.write(b'sciences\r\n')
+            self.assertEqual(mapped_file.get()[:], b'algo\r\nsciences\r\n')
+            self.assertTrue(first.closed)
+
+            mapped_file.close()
+
+    """
+    Test watcher calls back when the watched file changes
+    """
+    def test_file_watcher_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\n')
+
+            changed = threading.Event()
+            watcher = FileWatcher(data_path, changed.set, interval=0.05)
+            watcher.start()
+
+            """give the watcher time to record the current version"""
+            changed.wait(0.2)
+            self.assertFalse(changed.is_set())
+
+            with open(data_path, 'ab') as f:
+                f.write(b'sciences\r\n')
+            self.assertTrue(changed.wait(5))
+
+            watcher.stop()
+            watcher.join()
+
+            """test that data loaded before a change is reloaded at once"""
+            changed.clear()
+            watcher = FileWatcher(data_path, changed.set, interval=1,
+                                  key=file_key(data_path)[:2] + (0, 0))
+            watcher.start()
+            self.assertTrue(changed.wait(5))
+
+            watcher.stop()
+            watcher.join()
+
+    """
+    Test sliced search finds matches across slice boundaries
+    """
+    def test_find_in_success(self):
+        data = b'x' * (SLICE_BYTES - 2) + b'algo\r\n'
+        self.assertEqual(find_in(data, b'algo\r\n'), SLICE_BYTES - 2)
+        self.assertEqual(find_in(data, b'sciences'), -1)
+
+    """
+    Test line search matches whole stripped lines only
+    """
+    def test_find_line_success(self):
+        data = b'xalgo\r\nalgox\nalgo \r\nsciences'
+
+        """test that suffixes and prefixes of longer lines do not match"""
+        self.assertEqual(find_line(data, b'algo'), 13)
+        self.assertEqual(find_line(b'xalgo\r\nalgox\n', b'algo'), -1)
+
+        """test for a last line without terminator"""
+        self.assertEqual(find_line(data, b'sciences'), 20)
+
+        """test for illegal value"""
+        self.assertEqual(find_line(data, b'illegal value'), -1)
+        self.assertEqual(find_line(data, b''), -1)
+
+        """test that a query never matches across lines"""
+        self.assertEqual(find_line(data, b'algox\nalgo'), -1)
+
+        """test that a query common in longer lines is searched at once"""
+        common = b'0;1;2\n' * 200000 + b' 0 \r\n'
+        start = timer()
+        self.assertEqual(find_line(common, b'0'), len(common) - 4)
+        self.assertEqual(find_line(common[:-5], b';'), -1)
+        self.assertLess(timer() - start, 0.5)
+
+    """
+    Test segmented scan finds lines in any segment
+    """
+    def test_scanner_segments_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b''.join(
+                    b'%d\r\n' % number for number in range(10000)))
+
+            scanner = Scanner(data_path, 'thread', 2, segment_bytes=4096)
+
+            """test that segments end after a line terminator"""
+            bounds = scanner.segments()
+            self.assertGreater(len(bounds), 1)
+            data, _ = map_data(data_path)
+            for _, end in bounds:
+                self.assertEqual(data[end - 1:end], b'\n')
+
+            loop = asyncio.new_event_loop()
+            try:
+                """test for lines in the first and last segment"""
+                self.assertEqual(loop.run_until_complete(
+                    scanner.find(b'0')), 0)
+                self.assertGreater(loop.run_until_complete(
+                    scanner.find(b'9999')), 0)
+
+                """test for illegal value"""
+                self.assertEqual(loop.run_until_complete(
+                    scanner.find(b'algo')), -1)
+            finally:
+                loop.close()
+                scanner.close()
+
+    """
+    Test small batches are searched per query with the same results
+    """
+    def test_scan_lines_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\n sciences \nalgos')
+
+            found = [b'algo', b'sciences', b'algos']
+            missed = [b'lgo', b'algo s'] + [
+                b'miss %d' % number for number in range(FIND_QUERIES)]
+
+            """test for fewer queries than the batch threshold"""
+            self.assertEqual(
+                sorted(scan_lines(data_path, found[:2] + missed[:1])),
+                [b'algo', b'sciences'])
+
+            """test for a batch split into lines"""
+            self.assertEqual(
+                sorted(scan_lines(data_path, found + missed)), sorted(found))
+
+    """
+    Test a scan pool that lost a process is started again
+    """
+    def test_scanner_broken_pool_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\nsciences\n')
+
+            scanner = Scanner(data_path, 'process', 1)
+            loop = asyncio.new_event_loop()
+            try:
+                self.assertEqual(
+                    loop.run_until_complete(scanner.find(b'algo')), 0)
+
+                # kill the scan process and wait for the pool to notice
+                broken = scanner.executor
+                for pid in list(broken._processes):
+                    os.kill(pid, signal.SIGKILL)
+                for _ in range(100):
+                    if broken._broken:
+                        break
+                    time.sleep(0.05)
+
+                """test that the next lookup is answered by a new pool"""
+                self.assertEqual(
+                    loop.run_until_complete(scanner.find(b'sciences')), 6)
+                self.assertIsNot(scanner.executor, broken)
+            finally:
+                loop.close()
+                scanner.close()
+
+    """
+    Test concurrent queries are answered by one batched scan
+    """
+    def test_scanner_batch_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\r\n sciences \nalgos')
+
+            scanner = Scanner(data_path, 'thread', 2, batch_window=0.01)
+            queries = [b'algo', b'sciences', b'algos', b'lgo', b'algo']
+
+            async def find_all():
+                return await asyncio.gather(
+                    *(scanner.find(query) for query in queries))
+
+            loop = asyncio.new_event_loop()
+            try:
+                results = loop.run_until_complete(find_all())
+
+                """test that only whole lines are found"""
+                self.assertEqual(
+                    [result >= 0 for result in results],
+                    [True, True, True, False, True])
+
+                """test that no query is left in flight"""
+                self.assertEqual(scanner.inflight, {})
+            finally:
+                loop.close()
+                scanner.close()
+
+    """
+    Test binary protocol framing
+    """
+    def test_binary_framing_success(self):
+        request = pack_queries([b'algo', b' sciences '])
+
+        """test that a complete request is parsed and stripped"""
+        self.assertEqual(
+            unpack_queries(request, 0, 10),
+            ([b'algo', b'sciences'], len(request)))
+
+        """test that an incomplete request waits for more bytes"""
+        self.assertIsNone(unpack_queries(request[:-1], 0, 10))
+
+        """test that too many queries are refused"""
+        with self.assertRaises(ValueError):
+            unpack_queries(request, 0, 1)
+
+        """test that a request arriving in pieces is parsed once"""
+        parser = RequestParser(10)
+        buffer = bytearray()
+        parsed = []
+        for byte in request[:-1]:
+            buffer.append(byte)
+            self.assertIsNone(parser.parse(buffer, 0))
+            parsed.append(parser.parsed)
+        self.assertEqual(parsed, sorted(parsed))
+        self.assertEqual(parser.queries, [b'algo'])
+        buffer += request[-1:] + request
+        self.assertEqual(
+            parser.parse(buffer, 0), ([b'algo', b'sciences'], len(request)))
+        self.assertEqual(
+            parser.parse(buffer, len(request)),
+            ([b'algo', b'sciences'], len(buffer)))
+
+        """test that results survive packing"""
+        results = [True, False] * 5
+        self.assertEqual(unpack_results(pack_results(results)), results)
+
+    """
+    Test debug records are rate limited and others are not
+    """
+    def test_rate_limit_filter_success(self):
+        rate_limit = RateLimitFilter(2)
+
+        def record(level):
+            return logging.LogRecord('', level, '', 0, 'message', None, None)
+
+        passed = [rate_limit.filter(record(logging.DEBUG)) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        self.assertTrue(rate_limit.filter(record(logging.ERROR)))
+
+    """
+    Test records of a forked worker are written by the process it forwards to
+    """
+    def test_forward_records_success(self):
+        message = 'record forwarded by a worker of {}'.format(os.getpid())
+        share_handlers()
+        try:
+            pid = os.fork()
+            if pid == 0:
+                # the worker must not write the log file itself
+                file_handler.handle = lambda record: os._exit(1)
+                try:
+                    forward_records()
+                    logger.warning(message)
+                finally:
+                    stop_listener()
+                    os._exit(0)
+            _, status = os.waitpid(pid, 0)
+        finally:
+            stop_listener()
+            restart_listener()
+
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        with open(file_handler.baseFilename) as log:
+            self.assertIn(message, log.read())
+
+    """
+    Test latency histogram and prometheus rendering of metrics
+    """
+    def test_metrics_success(self):
+        histogram = Histogram()
+        for _ in range(99):
+            histogram.observe(0.0001)
+        histogram.observe(1)
+
+        """test that quantiles land in the bucket of their latency"""
+        self.assertTrue(0.0001 <= histogram.quantile(0.5) < 0.0002)
+        self.assertTrue(1 <= histogram.quantile(0.999) < 2)
+
+        metrics = Metrics()
+        metrics.queries = 3
+        metrics.observe('hash', 0.001)
+        text = metrics.render()
+
+        """test that counters and histogram buckets are rendered"""
+        self.assertIn('as_tcp_queries_total{{pid="{}"}} 3'.format(
+            os.getpid()), text)
+        self.assertIn('mode="hash",le="+Inf"} 1', text)
+
+    """
+    Test query mix and percentiles of the benchmark
+    """
+    def test_bench_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = path.join(directory, 'data.txt')
+            with open(data_path, 'wb') as f:
+                f.write(b'algo\nsciences\n  \nqueries\n')
+
+            hits = sample_lines(data_path, 50, seed=1)
+
+        """test that sampled lines are stripped lines of the file"""
+        self.assertTrue(set(hits) <= {b'algo', b'sciences', b'queries'})
+
+        queries = make_queries(hits, 1000, 0.25, seed=1)
+
+        """test that the hit ratio is roughly kept"""
+        expected = [query in hits for query, _ in queries]
+        self.assertEqual(expected, [hit for _, hit in queries])
+        self.assertTrue(150 < sum(expected) < 350)
+
+        """test nearest rank percentiles"""
+        latencies = list(range(1, 1001))
+        self.assertEqual(percentile(latencies, 50), 500)
+        self.assertEqual(percentile(latencies, 99.9), 999)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    """
+    Test REREAD result cache eviction and invalidation
+    """
+    def test_result_cache_success(self):
+        cache = ResultCache(2)
+        version = (1, 2, 3, 4)
+
+        self.assertIsNone(cache.get(version, b'algo'))
+        cache.put(version, b'algo', True)
+        cache.put(version, b'sciences', False)
+
+        """test that cached results are returned, misses included"""
+        self.assertTrue(cache.get(version, b'algo'))
+        self.assertIs(cache.get(version, b'sciences'), False)
+
+        """test that the least recently used result is evicted"""
+        cache.get(version, b'algo')
+        cache.put(version, b'queries', True)
+        self.assertIsNone(cache.get(version, b'sciences'))
+        self.assertEqual(cache.evictions, 1)
+
+        """test that another version of the file drops every result"""
+        self.assertIsNone(cache.get((1, 2, 4, 5), b'algo'))
+        self.assertEqual((len(cache), cache.invalidations), (0, 1))
+
+        """test that results of an older version are not cached"""
+        cache.put(version, b'algo', True)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+    """
+    Test worker count resolution
+    """
+    def test_worker_count_success(self):
+        """test that configured count is kept"""
+        self.assertEqual(worker_count(3), 3)
+
+        """test that 0 means one worker per cpu core"""
+        self.assertGreaterEqual(worker_count(0), 1)
+
+    """
+    Test event loop selection and listening socket options
+    """
+    def test_event_loop_and_socket_success(self):
+        """test that asyncio is used when asked or uvloop is missing"""
+        self.assertFalse(use_uvloop('asyncio'))
+        self.assertEqual(
+            use_uvloop('auto'),
+            importlib.util.find_spec('uvloop') is not None)
+
+        """test that unknown loops are refused"""
+        with self.assertRaises(ValueError):
+            use_uvloop('trio')
+
+        sock = listen_socket('127.0.0.1', 0, reuse_port=True)
+        try:
+            """test that the socket is bound and reuses its port"""
+            self.assertNotEqual(sock.getsockname()[1], 0)
+            self.assertTrue(sock.getsockopt(
+                socket.SOL_SOCKET, socket.SO_REUSEPORT))
+        finally:
+            sock.close()
+
+    """
+    Test the listening sockets handed to the supervisor a reload starts
+    """
+    def test_socket_handoff_success(self):
+        sock = listen_socket('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        stale = listen_socket('127.0.0.1', 0)
+
+        """test that a socket still on the port is kept and the rest closed"""
+        slots = socket_slots('127.0.0.1', port, 1, False,
+                             [(sock, None), (stale, None)])
+        try:
+            self.assertEqual(slots, [(sock, None)])
+            self.assertEqual(stale.fileno(), -1)
+
+            """test that the sockets are found again by their descriptors"""
+            environ = {HANDOFF_ENV: json.dumps(
+                {'parent': 1, 'slots': [[sock.fileno(), None]]})}
+            parent, inherited = inherited_sockets(environ)
+            self.assertEqual(parent, 1)
+            self.assertNotIn(HANDOFF_ENV, environ)
+            self.assertEqual(inherited[0][0].getsockname()[1], port)
+            self.assertIsNone(inherited[0][1])
+
+            # the same descriptor, owned by sock
+            inherited[0][0].detach()
+        finally:
+            sock.close()
+
+        """test that a fresh start inherits nothing"""
+        self.assertEqual(inherited_sockets({}), (None, []))
+
 
 if __name__ == '__main__':
     unittest.main()